@@ -0,0 +1,170 @@
+import os
+
+from llnl.util import tty
+from spack.spec import Spec
+
+import fnal.spack.dev as dev
+from fnal.spack.dev.environment import bootstrap_environment, \
+    environment_from_pickle
+from fnal.spack.dev.locks import metadata_lock, environment_lock
+from fnal.spack.dev.spec_store import Spec_store
+
+
+def _stamp(path):
+    """Identify the current state of a file for memo validation."""
+    try:
+        stat = os.stat(path)
+        return (stat.st_mtime, stat.st_size)
+    except OSError:
+        return None
+
+
+class Area:
+    """State of a SpackDev area (package lists, specs and package
+    environments), loaded lazily and at most once per process unless the
+    files from which it was loaded have since changed.
+    """
+    def __init__(self, base):
+        self.base = base
+        self._memo = {}
+
+    def path(self, *components):
+        return os.path.join(self.base, *components)
+
+    @property
+    def srcs_dir(self):
+        return self.path('srcs')
+
+    @property
+    def build_dir(self):
+        return self.path('build')
+
+    @property
+    def install_dir(self):
+        return self.path('install')
+
+    @property
+    def tmp_dir(self):
+        return self.path('tmp')
+
+    def package_dir(self, package):
+        return self.path(dev.spackdev_aux_packages_subdir, package)
+
+    def _memoized(self, key, stamp, loader):
+        memo = self._memo.get(key)
+        if memo is None or memo[0] != stamp:
+            memo = (stamp, loader())
+            self._memo[key] = memo
+        return memo[1]
+
+    def package_info(self):
+        """Return the package arguments for the requested and additional
+        packages, and the names of the dependencies, as recorded in
+        packages.sd."""
+        filename = self.path(dev.spackdev_aux_packages_sd_file)
+        with metadata_lock(self.base).read():
+            return self._memoized(filename, _stamp(filename),
+                                  lambda: self._read_package_info(filename))
+
+    @staticmethod
+    def _read_package_info(filename):
+        with open(filename, 'r') as f:
+            first_line = f.readline().rstrip()
+            if first_line.find('[') > -1:
+                tty.die('packages.sd in obsolete (unsafe) format: please re-execute spack init or initialize a new spackdev area.')
+            requested = first_line.split()
+            additional = f.readline().rstrip().split()
+            deps = f.readline().rstrip().split()
+        return requested, additional, deps
+
+    def spec_store(self):
+        """Return the spec store of the area, or None for areas
+        initialized before its introduction."""
+        store = Spec_store(self.path(dev.spackdev_aux_spec_store_subdir))
+        stamp = _stamp(store.index_file)
+        if stamp is None:
+            return None
+        return self._memoized(store.directory, stamp, lambda: store)
+
+    def specs(self):
+        """Return the concretized root specs of the area."""
+        with metadata_lock(self.base).read():
+            return self._specs()
+
+    def _specs(self):
+        store = self.spec_store()
+        if store:
+            return store.roots()
+        specs_dir = self.path(dev.spackdev_aux_specs_subdir)
+        if not os.path.exists(specs_dir):
+            tty.die('YAML spec information missing: please re-execute spack init or initialize a new spackdev area.')
+        spec_files = sorted([os.path.join(specs_dir, spec_file) for
+                             spec_file in os.listdir(specs_dir) if
+                             spec_file.endswith('.yaml')])
+        return self._memoized(specs_dir,
+                              [(spec_file, _stamp(spec_file)) for
+                               spec_file in spec_files],
+                              lambda: self._read_specs(spec_files))
+
+    @staticmethod
+    def _read_specs(spec_files):
+        specs = []
+        for spec_file in spec_files:
+            with open(spec_file, 'r') as f:
+                specs.append(Spec.from_yaml(f))
+        return specs
+
+    def spec_for(self, package):
+        """Return the concretized spec for package, or None."""
+        with metadata_lock(self.base).read():
+            store = self.spec_store()
+            if store:
+                return store.spec_for(package)
+            for spec in self._specs():
+                if package in spec:
+                    return spec[package]
+        return None
+
+    def dev_packages(self):
+        """Return the names of all packages under development."""
+        (requested, additional, deps) = self.package_info()
+        return [package_arg.split('@')[0].split('^')[0] for
+                package_arg in requested + additional]
+
+    def dev_package_dependencies(self):
+        """Return a dict of the sets of other packages under development on
+        which each package under development depends (directly or
+        indirectly)."""
+        dev_packages = self.dev_packages()
+        dependencies = {}
+        for package in dev_packages:
+            spec = self.spec_for(package)
+            dependencies[package]\
+                = set([dep.name for dep in spec.traverse(root=False) if
+                       dep.name in dev_packages]) if spec else set()
+        return dependencies
+
+    def package_environment(self, package):
+        """Return the saved build environment of a package under
+        development (not to be modified)."""
+        filename = os.path.join(self.package_dir(package), 'env',
+                                'env.pickle')
+        if not os.path.exists(filename):
+            tty.die('unable to find environment for {0}: not a package being developed?'.format(package))
+        with environment_lock(self.base, package).read():
+            return self._memoized(filename, _stamp(filename),
+                                  lambda: environment_from_pickle(filename))
+
+
+_current_area = None
+
+
+def current_area():
+    """Return the Area for the current SpackDev area, bootstrapping the
+    environment if necessary."""
+    global _current_area
+    bootstrap_environment()
+    base = os.environ['SPACKDEV_BASE']
+    if _current_area is None or _current_area.base != base:
+        _current_area = Area(base)
+    return _current_area
@@ -0,0 +1,92 @@
+import os
+import shutil
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+
+from llnl.util import tty
+
+import spack.binary_distribution as bindist
+import spack.store
+
+
+def missing_specs(dep_specs):
+    """Return the specs (including indirect dependencies) of dep_specs
+    that are not yet installed, dependencies first, without duplicates or
+    externals."""
+    result = []
+    seen = set()
+    for dep in dep_specs:
+        for spec in dep.traverse(order='post'):
+            dag_hash = spec.dag_hash()
+            if dag_hash in seen:
+                continue
+            seen.add(dag_hash)
+            if not (spec.external or spec.package.installed):
+                result.append(spec)
+    return result
+
+
+def tarball_for(spec, cache_dir):
+    """Return the path of the binary package for spec in the directory
+    mirror cache_dir, or None."""
+    tarball = os.path.join(cache_dir, 'build_cache',
+                           bindist.tarball_path_name(spec, '.spack'))
+    return tarball if os.path.exists(tarball) else None
+
+
+def _extract(task):
+    spec, tarball, unsigned = task
+    try:
+        bindist.extract_tarball(spec, tarball, allow_root=True,
+                                unsigned=unsigned)
+        return spec, None
+    except Exception as e:
+        # Leave no partial installation behind for the source build.
+        shutil.rmtree(spec.prefix, ignore_errors=True)
+        return spec, e
+
+
+def install_from_binary_cache(dep_specs, cache_dir, jobs=None,
+                              unsigned=False):
+    """Install what we can of dep_specs and their dependencies from the
+    binary packages in directory mirror cache_dir.
+
+    Matching packages are extracted and relocated in parallel, and then
+    registered in the install database in dependency order. Returns the
+    lists of specs installed from the cache and of those still to be
+    built.
+    """
+    missing = missing_specs(dep_specs)
+    tasks = []
+    misses = []
+    for spec in missing:
+        tarball = tarball_for(spec, cache_dir)
+        if tarball:
+            tasks.append((spec, tarball, unsigned))
+        else:
+            misses.append(spec)
+    hits = []
+    if tasks:
+        tty.msg('extracting {0} packages from binary cache {1}'.
+                format(len(tasks), cache_dir))
+        pool = ThreadPool(jobs or cpu_count())
+        try:
+            results = pool.map(_extract, tasks)
+        finally:
+            pool.close()
+            pool.join()
+        # Results are in task order, i.e. dependencies first.
+        for spec, error in results:
+            if error:
+                tty.warn('unable to install {0} from binary cache: {1}'.
+                         format(spec.cshort_spec, error))
+                misses.append(spec)
+            else:
+                spack.store.db.add(spec, spack.store.layout, explicit=False)
+                hits.append(spec)
+    tty.msg('binary cache {0}: {1} hits, {2} misses'.
+            format(cache_dir, len(hits), len(misses)))
+    if misses:
+        tty.msg('to be built from source: {0}'.
+                format(' '.join(sorted(spec.name for spec in misses))))
+    return hits, misses
@@ -0,0 +1,220 @@
+# Share CMake's compiler and platform detection between the packages of
+# a SpackDev area: detect once per combination of CMake, generator,
+# compilers and flags by configuring a trivial project with the real
+# compilers, then seed the results into each package's build directory
+# and initial cache with the package's compiler wrappers substituted.
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+
+from llnl.util import tty
+from llnl.util.filesystem import mkdirp
+
+import fnal.spack.dev as dev
+from fnal.spack.dev.environment import unquote
+
+# CMake language, wrapper variable and real compiler variable.
+_languages = (('C', 'CC', 'SPACK_CC'),
+              ('CXX', 'CXX', 'SPACK_CXX'),
+              ('Fortran', 'FC', 'SPACK_FC'))
+
+# Other inputs to detection.
+_key_vars = ('CFLAGS', 'CXXFLAGS', 'FFLAGS', 'LDFLAGS', 'SPACK_CFLAGS',
+             'SPACK_CPPFLAGS', 'SPACK_CXXFLAGS', 'SPACK_FFLAGS',
+             'SPACK_LDFLAGS', 'SPACK_TARGET_ARGS')
+
+# Cache entries set by detection that do not depend on the project.
+_seeded_entry\
+    = re.compile(r'^(?P<var>CMAKE_(?:(?:[A-Za-z]+_COMPILER_)?(?:ADDR2LINE|AR|DLLTOOL|LINKER|MT|NM|OBJCOPY|OBJDUMP|RANLIB|READELF|STRIP)|EXECUTABLE_FORMAT|UNAME))(?P<advanced>-ADVANCED)?:(?P<type>[A-Z]+)=(?P<value>.*)$')
+
+_version_dir = re.compile(r'^\d+\.\d+')
+
+_probe_project = '''cmake_minimum_required(VERSION 3.0)
+project(spackdev_seed NONE)
+foreach(lang {0})
+  enable_language(${{lang}})
+endforeach()
+'''
+
+# Per-package files.
+seed_record_file = 'cmake-seed.json'
+seed_initial_cache_file = 'cmake-seed.cmake'
+
+
+def _identity(path):
+    """Identify a file (e.g. a compiler) for cache invalidation."""
+    real_path = os.path.realpath(path)
+    stat = os.stat(real_path)
+    return [real_path, stat.st_size, stat.st_mtime]
+
+
+def _cmake_string(value):
+    return '"{0}"'.format(value.replace('\\', '\\\\').replace('"', '\\"'))
+
+
+def compilers_for(environment):
+    """Return the real compiler and wrapper for each language available
+    in a package environment."""
+    compilers = {}
+    for lang, wrapper_var, real_var in _languages:
+        real = unquote(environment.get(real_var, ''))
+        wrapper = unquote(environment.get(wrapper_var, ''))
+        if real and wrapper and os.path.isfile(real):
+            compilers[lang] = (real, wrapper)
+    return compilers
+
+
+def seed_key(cmake, generator, compilers, environment):
+    inputs = {'cmake': _identity(cmake),
+              'generator': generator,
+              'compilers': dict((lang, _identity(real)) for
+                                lang, (real, wrapper) in compilers.items()),
+              'environment': dict((var, unquote(environment.get(var, '')))
+                                  for var in _key_vars)}
+    return hashlib.sha1(json.dumps(inputs, sort_keys=True).encode('utf-8')).\
+        hexdigest()
+
+
+def detect(cmake, generator, compilers, environment, seed_dir):
+    """Configure a trivial project using the real compilers and save the
+    results of detection in seed_dir. Returns False on failure."""
+    parent = os.path.dirname(seed_dir)
+    mkdirp(parent)
+    work_dir = tempfile.mkdtemp(dir=parent, prefix='.detect.')
+    try:
+        src_dir = os.path.join(work_dir, 'src')
+        build_dir = os.path.join(work_dir, 'build')
+        mkdirp(src_dir, build_dir)
+        langs = sorted(compilers.keys())
+        with open(os.path.join(src_dir, 'CMakeLists.txt'), 'w') as f:
+            f.write(_probe_project.format(' '.join(langs)))
+        command = [cmake, '-G', generator] + \
+                  ['-DCMAKE_{0}_COMPILER={1}'.format(lang, compilers[lang][0])
+                   for lang in langs] + [src_dir]
+        env = os.environ.copy()
+        env.update((var, unquote(val)) for var, val in environment.items())
+        process = subprocess.Popen(command, cwd=build_dir, env=env,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT)
+        output = process.communicate()[0]
+        if process.returncode != 0:
+            tty.warn('CMake detection for {0} failed:\n{1}'.
+                     format(', '.join(langs), output))
+            return False
+        cmake_files = os.path.join(build_dir, 'CMakeFiles')
+        versions = [d for d in os.listdir(cmake_files) if
+                    _version_dir.match(d)]
+        if len(versions) != 1:
+            tty.warn('unable to identify CMake detection results in {0}'.
+                     format(cmake_files))
+            return False
+        files_dir = os.path.join(work_dir, 'seed', versions[0])
+        mkdirp(files_dir)
+        for filename in ['CMakeSystem.cmake'] + \
+            ['CMake{0}Compiler.cmake'.format(lang) for lang in langs]:
+            shutil.copy2(os.path.join(cmake_files, versions[0], filename),
+                         files_dir)
+        entries = []
+        with open(os.path.join(build_dir, 'CMakeCache.txt'), 'r') as f:
+            for line in f:
+                match = _seeded_entry.match(line.rstrip('\n'))
+                if match:
+                    entries.append(match.groupdict())
+        with open(os.path.join(work_dir, 'seed', 'seed.json'), 'w') as f:
+            json.dump({'version': versions[0],
+                       'languages': langs,
+                       'entries': entries}, f, indent=2)
+        try:
+            os.rename(os.path.join(work_dir, 'seed'), seed_dir)
+        except OSError:
+            # Created concurrently.
+            if not os.path.isdir(seed_dir):
+                raise
+        return True
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _compiler_setting(lang):
+    return re.compile(r'^set\(CMAKE_{0}_COMPILER ".*"\)$'.format(lang),
+                      re.MULTILINE)
+
+
+def prepare_package_seed(base, package, environment, cmake, generator):
+    """Make sure detection results are available for the compilers of
+    package, and prepare its seed files and initial cache (which is
+    returned), or return None if there is nothing to seed."""
+    compilers = compilers_for(environment)
+    if not compilers:
+        return None
+    key = seed_key(cmake, generator, compilers, environment)
+    seed_dir = os.path.join(base, dev.spackdev_aux_cmake_seed_subdir, key)
+    if not os.path.isdir(seed_dir):
+        tty.msg('detecting CMake compiler information for {0} (cached as {1})'.
+                format(package, key[:8]))
+        if not detect(cmake, generator, compilers, environment, seed_dir):
+            return None
+    with open(os.path.join(seed_dir, 'seed.json'), 'r') as f:
+        seed = json.load(f)
+
+    package_seed_dir = os.path.join(base, dev.spackdev_aux_packages_subdir,
+                                    package, 'cmake-seed')
+    shutil.rmtree(package_seed_dir, ignore_errors=True)
+    files_dir = os.path.join(package_seed_dir, seed['version'])
+    mkdirp(files_dir)
+    for filename in os.listdir(os.path.join(seed_dir, seed['version'])):
+        with open(os.path.join(seed_dir, seed['version'], filename),
+                  'r') as f:
+            contents = f.read()
+        for lang in seed['languages']:
+            contents = _compiler_setting(lang).sub\
+                (lambda match: 'set(CMAKE_{0}_COMPILER {1})'.
+                 format(lang, _cmake_string(compilers[lang][1])),
+                 contents)
+        with open(os.path.join(files_dir, filename), 'w') as f:
+            f.write(contents)
+
+    initial_cache = os.path.join(base, dev.spackdev_aux_packages_subdir,
+                                 package, seed_initial_cache_file)
+    with open(initial_cache, 'w') as f:
+        f.write('# SpackDev: CMake detection results for {0} (seed {1}).\n'.
+                format(package, key))
+        for lang in seed['languages']:
+            f.write('set(CMAKE_{0}_COMPILER {1} CACHE FILEPATH "{0} compiler")\n'.
+                    format(lang, _cmake_string(compilers[lang][1])))
+        for entry in seed['entries']:
+            if entry['advanced']:
+                f.write('mark_as_advanced({var})\n'.format(**entry))
+            else:
+                f.write('set({0} {1} CACHE {2} "")\n'.
+                        format(entry['var'], _cmake_string(entry['value']),
+                               entry['type']))
+        # Otherwise CMake discards the seeded detection results.
+        f.write('set(CMAKE_PLATFORM_INFO_INITIALIZED 1 CACHE INTERNAL "")\n')
+    with open(os.path.join(base, dev.spackdev_aux_packages_subdir, package,
+                           seed_record_file), 'w') as f:
+        json.dump({'key': key, 'version': seed['version']}, f)
+    return initial_cache
+
+
+def apply_package_seed(base, package, build_dir):
+    """Seed the detection results for package into build_dir if it has
+    not already been configured."""
+    record_file = os.path.join(base, dev.spackdev_aux_packages_subdir,
+                               package, seed_record_file)
+    if os.path.exists(os.path.join(build_dir, 'CMakeCache.txt')) or \
+       not os.path.exists(record_file):
+        return False
+    with open(record_file, 'r') as f:
+        record = json.load(f)
+    dest = os.path.join(build_dir, 'CMakeFiles', record['version'])
+    shutil.rmtree(dest, ignore_errors=True)
+    shutil.copytree(os.path.join(base, dev.spackdev_aux_packages_subdir,
+                                 package, 'cmake-seed', record['version']),
+                    dest)
+    return True
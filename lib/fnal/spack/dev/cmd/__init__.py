@@ -3,15 +3,20 @@ import os
 import re
 import shutil
 import six
+import tempfile
+import time
 
 from llnl.util import tty
 from llnl.util.filesystem import mkdirp
 
-import fnal.spack.dev as dev
+from fnal.spack.dev.area import current_area
+from fnal.spack.dev.locks import stage_lock
+import fnal.spack.dev.metrics as metrics
+import fnal.spack.dev.partial_clone as partial_clone
 
 from spack.error import SpackError
 import spack.fetch_strategy as fs
-from spack.spec import Spec
+import spack.store
 from spack.stage import Stage
 from spack.version import Version
 
@@ -73,31 +78,35 @@ class DevPackageInfo:
         return self.package_arg
 
 
+def write_file_atomically(filename, contents, mode=0o644):
+    """Write contents to filename by way of a temporary file in the same
+    directory, so that concurrent readers see either the old or the new
+    file but never a partial one.
+    """
+    dirname = os.path.dirname(os.path.abspath(filename))
+    mkdirp(dirname)
+    fd, tmp_filename\
+        = tempfile.mkstemp(dir=dirname,
+                           prefix='.{0}.'.format(os.path.basename(filename)))
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(contents)
+        os.chmod(tmp_filename, mode)
+        os.rename(tmp_filename, filename)
+    except:
+        os.remove(tmp_filename)
+        raise
+
+
 def read_package_info(want_specs=True):
-    dev.environment.bootstrap_environment()
-    packages_filename = os.path.join(os.environ['SPACKDEV_BASE'],
-                                     dev.spackdev_aux_packages_sd_file)
-    with open(packages_filename, 'r') as f:
-        first_line = f.readline().rstrip()
-        if first_line.find('[') > -1:
-            tty.die('packages.sd in obsolete (unsafe) format: please re-execute spack init or initialize a new spackdev area.')
-        requesteds = [ DevPackageInfo(package_arg) for
-                       package_arg in first_line.split() ]
-        additional = [ DevPackageInfo(package_arg) for
-                       package_arg in f.readline().rstrip().split() ]
-        deps = f.readline().rstrip().split()
-
-    install_specs = []
+    area = current_area()
+    (requested_args, additional_args, deps) = area.package_info()
+    requesteds = [ DevPackageInfo(package_arg) for
+                   package_arg in requested_args ]
+    additional = [ DevPackageInfo(package_arg) for
+                   package_arg in additional_args ]
     if want_specs:
-        specs_dir = os.path.join(os.environ['SPACKDEV_BASE'],
-                                 dev.spackdev_aux_specs_subdir)
-        if not os.path.exists(specs_dir):
-            tty.die('YAML spec information missing: please re-execute spack init or initialize a new spackdev area.')
-        for spec_file in os.listdir(specs_dir):
-            if spec_file.endswith('.yaml'):
-                with open(os.path.join(specs_dir, spec_file), 'r') as f:
-                    install_specs.append(Spec.from_yaml(f))
-        return requesteds, additional, deps, install_specs
+        return requesteds, additional, deps, area.specs()
 
     return requesteds, additional, deps
 
@@ -188,9 +197,39 @@ source we want to develop for this package.
                         spack_package.version))
 
 
-def stage_package(dp, spec):
+def stage_package(dp, spec, clone_depth=None, clone_filter=None):
+    area = current_area()
+    with stage_lock(area.base, dp.name).write():
+        _stage_package(area, dp, spec, clone_depth, clone_filter)
+
+
+def _partial_clone(package, spec, package_dest, clone_depth, clone_filter):
+    """Clone the git repository of package directly into package_dest
+    with limited depth and/or a filter, if so configured. Returns a
+    description of the clone or None if the package should be staged
+    by Spack."""
+    (depth, filter_spec)\
+        = partial_clone.clone_settings(clone_depth, clone_filter)
+    fetcher = spec.package.fetcher
+    if not ((depth or filter_spec) and
+            isinstance(fetcher, fs.GitFetchStrategy)):
+        return None
+    try:
+        partial_clone.clone(fetcher, package_dest, depth, filter_spec)
+    except partial_clone.Clone_error as e:
+        tty.warn('partial clone of {0} failed: falling back to a full '
+                 'clone\n{1}'.format(package, e))
+        shutil.rmtree(package_dest, ignore_errors=True)
+        return None
+    return ' '.join(option for option in
+                    ('depth {0}'.format(depth) if depth else None,
+                     'filter {0}'.format(filter_spec) if filter_spec
+                     else None) if option)
+
+
+def _stage_package(area, dp, spec, clone_depth=None, clone_filter=None):
     package = dp.name
-    topdir = dev.environment.srcs_topdir()
+    topdir = area.srcs_dir
     if not os.path.exists(topdir):
         os.mkdir(topdir)
     package_dest = os.path.join(topdir, package)
@@ -199,29 +238,45 @@ def stage_package(dp, spec):
                 format(package))
         return
     tty.msg('Staging {0} for development'.format(package))
+    start = time.time()
     _tweak_dev_package_fetcher(dp, spec)
-    spec.package.do_stage()
-    if os.path.exists(os.path.join(spec.package.path,
-                                   'spack-expanded-archive')):
-        package_path = os.path.join(spec.package.path,
-                                   'spack-expanded-archive')
-    else:
-        package_path = spec.package.path
-
-    files_or_dirs = os.listdir(package_path)
-    if len(files_or_dirs) > 1:  # Automatic consolidation.
-        mkdirp(package_dest)
-    for file_or_dir in files_or_dirs:
-        tty.debug('Moving {0} to {1}'.
-                  format(os.path.join(package_path, file_or_dir),
-                         package_dest))
-        shutil.move(os.path.join(package_path, file_or_dir),
-                    package_dest)
-
-
-def stage_packages(dev_package_info, package_specs):
+    clone = _partial_clone(package, spec, package_dest, clone_depth,
+                           clone_filter)
+    if clone is None:
+        spec.package.do_stage()
+        if os.path.exists(os.path.join(spec.package.path,
+                                       'spack-expanded-archive')):
+            package_path = os.path.join(spec.package.path,
+                                        'spack-expanded-archive')
+        else:
+            package_path = spec.package.path
+
+        files_or_dirs = os.listdir(package_path)
+        if len(files_or_dirs) > 1:  # Automatic consolidation.
+            mkdirp(package_dest)
+        for file_or_dir in files_or_dirs:
+            tty.debug('Moving {0} to {1}'.
+                      format(os.path.join(package_path, file_or_dir),
+                             package_dest))
+            shutil.move(os.path.join(package_path, file_or_dir),
+                        package_dest)
+    seconds = time.time() - start
+    size = metrics.tree_size(package_dest)
+    # Allow comparison of partial clones with full ones.
+    tty.msg('Staged {0} in {1:.1f} s: {2:.1f} MiB ({3})'.
+            format(package, seconds, size / 1048576.0,
+                   'clone with {0}'.format(clone) if clone else
+                   'as fetched by Spack'))
+    if metrics.enabled():
+        labels = {'package': package}
+        metrics.record([('spackdev_stage_seconds', labels, seconds),
+                        ('spackdev_stage_bytes', labels, size)])
+
+
+def stage_packages(dev_package_info, package_specs, clone_depth=None,
+                   clone_filter=None):
     for dp in dev_package_info:
-        stage_package(dp, package_specs[dp.name])
+        stage_package(dp, package_specs[dp.name], clone_depth, clone_filter)
 
 
 def get_package_spec(package, specs):
@@ -234,12 +289,41 @@ def install_dependencies(**kwargs):
         dep_specs = kwargs['dep_specs']
     else:
         # Concretization is necessary.
-        (requested_info, additional_info, deps, install_specs) = read_package_info()
+        (requested_info, additional_info, deps) = read_package_info(want_specs=False)
         dev_package_info = requested_info + additional_info
-        dep_specs = [ get_package_spec(dep, install_specs) for dep in deps ]
-
-    tty.msg('requesting spack install of dependencies for: {0}'
-            .format(' '.join([dp.name for dp in dev_package_info])))
-    for dep in dep_specs:
-        tty.debug('installing dependency {0}'.format(dep.name))
-        dep.package.do_install()
+        dep_specs = [ current_area().spec_for(dep) for dep in deps ]
+
+    start = time.time()
+    # Dependencies installed from source are those still missing after
+    # the binary cache has been consulted.
+    with spack.store.db.read_transaction():
+        missing = set(spec.dag_hash() for dep in dep_specs for
+                      spec in dep.traverse() if
+                      not (spec.external or spec.package.installed))
+    hits = []
+    if not missing:
+        # E.g. spack dev init --from-hash.
+        tty.msg('all dependencies are already installed')
+    else:
+        binary_cache = kwargs.get('binary_cache') or \
+                       os.environ.get('SPACKDEV_BINARY_CACHE')
+        if binary_cache:
+            # Only load binary distribution support if we need it.
+            from fnal.spack.dev.binary_cache import install_from_binary_cache
+            (hits, misses)\
+                = install_from_binary_cache(dep_specs, binary_cache,
+                                            kwargs.get('jobs'),
+                                            kwargs.get('unsigned', False))
+
+        tty.msg('requesting spack install of dependencies for: {0}'
+                .format(' '.join([dp.name for dp in dev_package_info])))
+        for dep in dep_specs:
+            tty.debug('installing dependency {0}'.format(dep.name))
+            dep.package.do_install()
+    if metrics.enabled():
+        metrics.record([('spackdev_dependencies_installed',
+                         {'origin': 'binary-cache'}, len(hits)),
+                        ('spackdev_dependencies_installed',
+                         {'origin': 'source'}, len(missing) - len(hits)),
+                        ('spackdev_dependencies_install_seconds', {},
+                         time.time() - start)])
@@ -0,0 +1,142 @@
+from __future__ import print_function
+
+import os
+import sys
+import threading
+import time
+from multiprocessing import cpu_count
+
+from llnl.util import tty
+
+from fnal.spack.dev.area import current_area
+from fnal.spack.dev.cmd.configure import configure_package
+from fnal.spack.dev.cmd.foreach import selected_packages, report_result, \
+    summarize_results
+from fnal.spack.dev.environment import load_environment
+from fnal.spack.dev.fingerprint import source_fingerprints, \
+    recorded_fingerprint, record_fingerprint, forget_fingerprint
+from fnal.spack.dev.metrics import record_results
+from fnal.spack.dev.runner import Package_result, run_in_package, \
+    run_for_packages
+from fnal.spack.dev.tree_roots import check_trees
+
+description = "build spackdev packages (optionally only those changed since they were last built) in dependency order"
+
+
+def setup_parser(subparser):
+    subparser.add_argument('-c', '--changed', action='store_true',
+                           default=False,
+                           help='build only packages whose sources have changed since their last successful build, and packages that depend on them')
+    subparser.add_argument('-n', '--dry-run', action='store_true',
+                           default=False,
+                           help='list the packages that would be built')
+    subparser.add_argument('-j', '--jobs', type=int,
+                           help='number of packages to build concurrently (default number of cores)')
+    subparser.add_argument('-t', '--target', default='install',
+                           help='build target for each package (default install)')
+    subparser.add_argument('-v', '--verbose', action='store_true',
+                           default=False,
+                           help='show build output for successful packages as well as failed ones')
+    subparser.add_argument('packages', nargs='*', metavar='PACKAGE',
+                           help='packages to consider (default is all packages)')
+
+
+def affected_packages(packages, changed, dependencies,
+                      include_dependents=True):
+    """Return those of packages that have changed or (optionally) depend
+    on packages that have changed."""
+    return [package for package in packages if
+            package in changed or
+            (include_dependents and dependencies[package] & changed)]
+
+
+def changed_packages(area, packages, jobs=None):
+    """Return those of packages whose sources have changed since their last
+    successful build, with the current fingerprints of all of packages."""
+    fingerprints = source_fingerprints(area, packages, jobs)
+    changed = set(package for package in packages if
+                  fingerprints[package] !=
+                  recorded_fingerprint(area, package))
+    return changed, fingerprints
+
+
+def build_command(area, package, target):
+    cmake = os.path.join(area.package_dir(package), 'bin', 'cmake')
+    return [cmake if os.path.exists(cmake) else 'cmake',
+            '--build', '.', '--target', target]
+
+
+def build_package(area, package, target):
+    """Build target in the build directory of package, configuring it
+    first if necessary."""
+    build_dir = os.path.join(area.build_dir, package)
+    if not os.path.exists(os.path.join(build_dir, 'CMakeCache.txt')):
+        result = configure_package(area, package)
+        if not result.succeeded:
+            return result
+    environment = load_environment(package)
+    environment.setdefault('CMAKE_BUILD_PARALLEL_LEVEL', str(cpu_count()))
+    return run_in_package(package, build_command(area, package, target),
+                          build_dir, environment)
+
+
+def build_packages(area, packages, target='install', jobs=None,
+                   verbose=False, fingerprints=None):
+    """Build packages in dependency order, reporting each result as it
+    becomes available. The source fingerprint of each package built
+    successfully (as given, or computed before the build starts) is
+    recorded for spack dev build --changed, and that of each package not
+    built successfully is forgotten."""
+    if fingerprints is None:
+        fingerprints = source_fingerprints(area, packages, jobs)
+    output_lock = threading.Lock()
+
+    def task(package):
+        result = build_package(area, package, target)
+        if result.succeeded and target == 'install':
+            record_fingerprint(area, package, fingerprints[package])
+        return result
+
+    def callback(result):
+        if not result.succeeded:
+            forget_fingerprint(area, result.package)
+        with output_lock:
+            if result.succeeded and not verbose:
+                result = Package_result(result.package, result.returncode,
+                                        '', result.seconds)
+            report_result(result)
+
+    results = run_for_packages(packages, task, jobs or cpu_count(),
+                               area.dev_package_dependencies(), callback)
+    record_results(area, 'build', results)
+    return results
+
+
+def build(parser, args):
+    start = time.time()
+    area = current_area()
+    check_trees(area)
+    packages = selected_packages(area, args.packages)
+    fingerprints = None
+    if args.changed:
+        (changed, fingerprints) = changed_packages(area, packages, args.jobs)
+        packages = affected_packages(area.dev_packages(), changed,
+                                     area.dev_package_dependencies())
+        tty.msg('changed: {0} ({1:.1f} s)'.
+                format(' '.join(sorted(changed)) or 'none',
+                       time.time() - start))
+    if not packages:
+        tty.msg('nothing to build')
+        return
+    if args.dry_run:
+        tty.msg('would build: {0}'.format(' '.join(packages)))
+        return
+    if fingerprints is not None:
+        missing = [package for package in packages if
+                   package not in fingerprints]
+        fingerprints.update(source_fingerprints(area, missing, args.jobs))
+    tty.msg('building {0}'.format(' '.join(packages)))
+    results = build_packages(area, packages, args.target, args.jobs,
+                             args.verbose, fingerprints)
+    tty.msg('build complete ({0:.1f} s)'.format(time.time() - start))
+    sys.exit(summarize_results(results))
@@ -9,6 +9,7 @@ import tempfile
 from llnl.util import tty
 
 import fnal.spack.dev as dev
+from fnal.spack.dev.area import current_area
 from fnal.spack.dev.environment import bootstrap_environment, \
     load_environment, sanitized_environment, environment_from_pickle
 
@@ -56,8 +57,7 @@ def build_env(parser, args):
 
     environment = load_environment(args.package)
     if args.cd:
-        os.chdir(os.path.join(os.environ['SPACKDEV_BASE'],
-                              'build', args.package))
+        os.chdir(os.path.join(current_area().build_dir, args.package))
     tty.msg('executing {0} in environment for package {1} in directory {2}'.
             format(' '.join(args.cmd), args.package, os.getcwd()))
     os.execvpe(args.cmd[0], args.cmd, environment)
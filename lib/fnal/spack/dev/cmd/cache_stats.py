@@ -0,0 +1,85 @@
+from __future__ import print_function
+
+import os
+import subprocess
+
+from llnl.util import tty
+
+from fnal.spack.dev.area import current_area
+from fnal.spack.dev.cmd.foreach import selected_packages
+
+description = "report compiler cache hit rates for spackdev packages"
+
+# ccache statistics log entries by category.
+_hit_entries = ('direct_cache_hit', 'preprocessed_cache_hit',
+                'remote_cache_hit')
+_miss_entries = ('cache_miss',)
+
+
+def setup_parser(subparser):
+    subparser.add_argument('-z', '--zero', action='store_true', default=False,
+                           help='reset the statistics of the selected packages after reporting')
+    subparser.add_argument('packages', nargs='*', metavar='PACKAGE',
+                           help='packages for which to report (default is all packages)')
+
+
+def statslog_for(area, package):
+    # Cf. compiler_cache_statslog in init.
+    return os.path.join(area.package_dir(package), 'env',
+                        'compiler-cache-stats.log')
+
+
+def read_statslog(filename):
+    """Return the numbers of hits, misses and other (uncacheable or
+    failed) compilations recorded in a ccache statistics log."""
+    counts = [0, 0, 0]
+    if os.path.exists(filename):
+        with open(filename, 'r') as f:
+            for line in f:
+                entry = line.strip()
+                if not entry or entry.startswith('#'):
+                    continue
+                elif entry in _hit_entries:
+                    counts[0] += 1
+                elif entry in _miss_entries:
+                    counts[1] += 1
+                else:
+                    counts[2] += 1
+    return counts
+
+
+def hit_rate(hits, misses):
+    return '{0:.1f}%'.format(100.0 * hits / (hits + misses)) if \
+        hits + misses else '-'
+
+
+def cache_stats(parser, args):
+    area = current_area()
+    tool = os.environ.get('SPACKDEV_COMPILER_CACHE')
+    if not tool:
+        tty.die('no compiler cache configured for this area: see spack dev init --compiler-cache')
+    if os.path.basename(tool).startswith('sccache'):
+        # sccache has no per-invocation log from which to attribute
+        # results to packages.
+        tty.msg('per-package statistics are not available for sccache: overall statistics follow')
+        subprocess.call([tool, '--show-stats'])
+        if args.zero:
+            subprocess.call([tool, '--zero-stats'])
+        return
+
+    packages = selected_packages(area, args.packages)
+    width = max([len(package) for package in packages] + [len('package')])
+    row = '{0:<{width}}  {1:>8}  {2:>8}  {3:>8}  {4:>8}'
+    print(row.format('package', 'hits', 'misses', 'other', 'hit rate',
+                     width=width))
+    totals = [0, 0, 0]
+    for package in packages:
+        statslog = statslog_for(area, package)
+        counts = read_statslog(statslog)
+        totals = [total + count for total, count in zip(totals, counts)]
+        print(row.format(package, counts[0], counts[1], counts[2],
+                         hit_rate(counts[0], counts[1]), width=width))
+        if args.zero and os.path.exists(statslog):
+            os.remove(statslog)
+    print(row.format('total', totals[0], totals[1], totals[2],
+                     hit_rate(totals[0], totals[1]), width=width))
@@ -0,0 +1,254 @@
+from __future__ import print_function
+
+import os
+import shutil
+import subprocess
+import time
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+
+from llnl.util import tty
+from llnl.util.filesystem import mkdirp
+from six.moves import shlex_quote as cmd_quote
+
+import fnal.spack.dev as dev
+from fnal.spack.dev.area import Area
+from fnal.spack.dev.cmake_seed import apply_package_seed
+from fnal.spack.dev.cmd.relocate import relocate_area
+from fnal.spack.dev.environment import bootstrap_environment, \
+    environment_from_pickle, unquote
+from fnal.spack.dev.locks import metadata_lock
+from fnal.spack.dev.tree_roots import trees, tree_path, place_trees, \
+    build_root_var, install_root_var
+
+import spack.util.executable
+
+description = "create a new spackdev area from an existing one, reusing its sources, environments and dependencies"
+
+_srcs_modes = ('auto', 'reflink', 'worktree', 'hardlink', 'copy')
+
+# Not carried over to the new area.
+_aux_excludes = ('compiler-cache', 'locks', '.tmp')
+
+
+def setup_parser(subparser):
+    subparser.add_argument('--srcs-mode', choices=_srcs_modes,
+                           default='auto',
+                           help='how to copy package sources: reflink (copy-on-write copy), worktree (git worktree of the current commit), hardlink (copy, hard-linking git objects), copy or auto (default: reflink if supported, otherwise worktree for clean git checkouts, otherwise hardlink)')
+    subparser.add_argument('-j', '--jobs', type=int,
+                           help='number of packages to copy concurrently (default number of cores)')
+    subparser.add_argument('src_area', metavar='SRC-AREA',
+                           help='existing spackdev area')
+    subparser.add_argument('dest', metavar='DEST',
+                           help='new spackdev area (must not exist, or be empty)')
+
+
+def _git(src, *args):
+    return subprocess.check_output(['git', '-C', src] + list(args),
+                                   stderr=subprocess.STDOUT)
+
+
+def _is_clean_checkout(src):
+    """Can src be reproduced exactly by a git worktree?"""
+    if not os.path.exists(os.path.join(src, '.git')) or \
+       os.path.exists(os.path.join(src, '.gitmodules')):
+        return False
+    try:
+        return _git(src, 'status', '--porcelain').strip() == b''
+    except (OSError, subprocess.CalledProcessError):
+        return False
+
+
+def copy_reflink(src, dest):
+    subprocess.check_output(['cp', '-a', '--reflink=always', src, dest],
+                            stderr=subprocess.STDOUT)
+
+
+def copy_worktree(src, dest):
+    _git(src, 'worktree', 'add', '--detach', dest, 'HEAD')
+
+
+def copy_hardlink(src, dest):
+    """Copy src to dest, hard-linking (immutable) git object files."""
+    objects_dir = os.path.join(src, '.git', 'objects')
+    for root, dirs, files in os.walk(src):
+        dest_root = os.path.join(dest, os.path.relpath(root, src))
+        mkdirp(dest_root)
+        shutil.copystat(root, dest_root)
+        link_files = root == objects_dir or \
+            root.startswith(objects_dir + os.sep)
+        for name in files + [d for d in dirs if
+                             os.path.islink(os.path.join(root, d))]:
+            path = os.path.join(root, name)
+            dest_path = os.path.join(dest_root, name)
+            if os.path.islink(path):
+                os.symlink(os.readlink(path), dest_path)
+            elif link_files:
+                try:
+                    os.link(path, dest_path)
+                except OSError:
+                    # E.g. different filesystems.
+                    shutil.copy2(path, dest_path)
+            else:
+                shutil.copy2(path, dest_path)
+
+
+def copy_tree(src, dest):
+    shutil.copytree(src, dest, symlinks=True)
+
+
+_copiers = {'reflink': copy_reflink,
+            'worktree': copy_worktree,
+            'hardlink': copy_hardlink,
+            'copy': copy_tree}
+
+
+def copy_sources(src, dest, mode):
+    """Copy the sources of a package according to mode, returning the
+    mode actually used."""
+    if mode != 'auto':
+        _copiers[mode](src, dest)
+        return mode
+    try:
+        copy_reflink(src, dest)
+        return 'reflink'
+    except (OSError, subprocess.CalledProcessError):
+        shutil.rmtree(dest, ignore_errors=True)
+    if _is_clean_checkout(src):
+        try:
+            copy_worktree(src, dest)
+            return 'worktree'
+        except (OSError, subprocess.CalledProcessError):
+            shutil.rmtree(dest, ignore_errors=True)
+    copy_hardlink(src, dest)
+    return 'hardlink'
+
+
+def _copy_package_sources(task):
+    package, src, dest, mode = task
+    try:
+        return package, copy_sources(src, dest, mode), None
+    except (IOError, OSError, shutil.Error,
+            subprocess.CalledProcessError) as e:
+        return package, None, getattr(e, 'output', None) or str(e)
+
+
+def clone_sources(src_area, dest_area, packages, mode, jobs):
+    mkdirp(dest_area.srcs_dir)
+    tasks = [(package,
+              os.path.join(src_area.srcs_dir, package),
+              os.path.join(dest_area.srcs_dir, package),
+              mode) for package in packages if
+             os.path.isdir(os.path.join(src_area.srcs_dir, package))]
+    pool = ThreadPool(jobs or cpu_count())
+    try:
+        results = pool.map(_copy_package_sources, tasks)
+    finally:
+        pool.close()
+        pool.join()
+    failed = []
+    for package, used_mode, error in results:
+        if error:
+            tty.error('unable to copy sources for {0}: {1}'.
+                      format(package, error.rstrip()))
+            failed.append(package)
+        else:
+            tty.debug('copied sources for {0} ({1})'.
+                      format(package, used_mode))
+    if failed:
+        tty.die('spack dev clone: unable to copy sources for {0}'.
+                format(' '.join(failed)))
+
+
+def clone_aux(src_area, dest_area):
+    shutil.copytree(src_area.path(dev.spackdev_aux_subdir),
+                    dest_area.path(dev.spackdev_aux_subdir),
+                    symlinks=True,
+                    ignore=shutil.ignore_patterns(*_aux_excludes))
+    shutil.copy2(os.path.join(src_area.srcs_dir, 'CMakeLists.txt'),
+                 dest_area.srcs_dir)
+
+
+def share_compiler_cache(src_area, dest_area):
+    """Share the default compiler cache of src_area, whose entries are
+    independent of the area's location."""
+    cache_dir = src_area.path(dev.spackdev_aux_subdir, 'compiler-cache')
+    if os.path.isdir(cache_dir):
+        os.symlink(cache_dir,
+                   dest_area.path(dev.spackdev_aux_subdir, 'compiler-cache'))
+
+
+def init_build_area(area, generator):
+    mkdirp(area.build_dir)
+    os.chdir(area.build_dir)
+    cmake = spack.util.executable.Executable('cmake')
+    cmd_args = [area.srcs_dir, '-G', generator]
+    try:
+        cmake(*cmd_args, output=str, error=str)
+    except spack.util.executable.ProcessError as e:
+        tty.die('''the SpackDev area has been cloned, but the initial
+CMake command failed with message:
+"{msg}". When you have addressed any problems, run:
+  . {env}
+  cd {build_dir}
+  {cmd}'''.
+                format(msg='\n'.join([e.message, e.long_message]),
+                       env=cmd_quote(area.path(dev.spackdev_aux_env_subdir,
+                                               'env.sh')),
+                       build_dir=cmd_quote(area.build_dir),
+                       cmd=' '.join([cmd_quote(x) for x in
+                                     [cmake.name] + cmd_args])))
+    for package in area.dev_packages():
+        apply_package_seed(area.base, package,
+                           os.path.join(area.build_dir, package))
+
+
+def clone(parser, args):
+    start = time.time()
+    src_base = os.path.abspath(os.path.expanduser(args.src_area))
+    env_file = os.path.join(src_base, dev.spackdev_aux_env_subdir,
+                            'env.pickle')
+    if not (os.path.exists(env_file) and
+            os.path.exists(os.path.join(src_base,
+                                        dev.spackdev_aux_packages_sd_file))):
+        tty.die('spack dev clone: {0} is not an initialized SpackDev area'.
+                format(src_base))
+    dest_base = os.path.abspath(os.path.expanduser(args.dest))
+    if os.path.exists(dest_base) and os.listdir(dest_base):
+        tty.die('spack dev clone: refusing to use non-empty directory {0}'.
+                format(dest_base))
+
+    src_environment = environment_from_pickle(env_file)
+    # The location recorded in the area's files.
+    old_base = unquote(src_environment['SPACKDEV_BASE'])
+    src_area = Area(src_base)
+    dest_area = Area(dest_base)
+    packages = src_area.dev_packages()
+
+    tty.msg('copy sources for {0}'.format(packages))
+    clone_sources(src_area, dest_area, packages, args.srcs_mode, args.jobs)
+
+    tty.msg('copy and relocate environments and wrappers')
+    with metadata_lock(src_base).read():
+        clone_aux(src_area, dest_area)
+    # Trees of the source area placed elsewhere (whose locations are
+    # recorded in its files) are placed likewise for the clone.
+    old_trees = dict((tree, tree_path(src_base, tree)) for tree in trees
+                     if os.path.islink(src_area.path(tree)))
+    place_trees(dest_base,
+                unquote(src_environment.get(build_root_var, '')) or None,
+                unquote(src_environment.get(install_root_var, '')) or None)
+    (changed, not_relocated) = relocate_area(dest_area, old_base, old_trees)
+    tty.debug('relocated {0} files'.format(len(changed)))
+    share_compiler_cache(src_area, dest_area)
+
+    tty.msg('initialize build area')
+    bootstrap_environment(dest_base)
+    init_build_area(dest_area,
+                    unquote(src_environment.get('SPACKDEV_GENERATOR',
+                                                'Unix Makefiles')))
+
+    tty.msg('clone of {0} as {1} complete ({2:.1f} s);'.
+            format(src_base, dest_base, time.time() - start))
+    tty.msg('source {0} to begin (spack dev configure will configure all packages in parallel).'.
+            format(dest_area.path(dev.spackdev_aux_env_subdir, 'env.sh')))
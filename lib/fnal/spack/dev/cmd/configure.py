@@ -0,0 +1,133 @@
+from __future__ import print_function
+
+import json
+import os
+import sys
+import threading
+from multiprocessing import cpu_count
+
+from llnl.util import tty
+from llnl.util.filesystem import mkdirp
+
+import fnal.spack.dev as dev
+from fnal.spack.dev.area import current_area
+from fnal.spack.dev.cmake_seed import apply_package_seed
+from fnal.spack.dev.cmd.foreach import selected_packages, report_result, \
+    summarize_results
+from fnal.spack.dev.metrics import record_results
+from fnal.spack.dev.runner import Package_result, run_in_package, \
+    run_for_packages
+from fnal.spack.dev.tree_roots import check_trees
+
+description = "configure spackdev packages concurrently, outside the superbuild"
+
+# Arguments passed to CMake by the superbuild for each package, as
+# recorded by spack dev init.
+configure_args_file = 'configure-args.json'
+
+# ExternalProject steps up to and including configure, in order.
+_configure_steps = ('mkdir', 'download', 'update', 'patch', 'configure')
+
+
+def setup_parser(subparser):
+    subparser.add_argument('-j', '--jobs', type=int,
+                           help='number of packages to configure concurrently (default number of cores)')
+    subparser.add_argument('-f', '--force', action='store_true',
+                           default=False,
+                           help='configure packages even if they have already been configured')
+    subparser.add_argument('packages', nargs='*', metavar='PACKAGE',
+                           help='packages to configure (default is all packages)')
+
+
+def stamp_file(area, package, step):
+    return os.path.join(area.tmp_dir, package, 'stamp',
+                        '{0}-{1}'.format(package, step))
+
+
+def is_configured(area, package):
+    return os.path.exists(stamp_file(area, package, 'configure')) and \
+        os.path.exists(os.path.join(area.build_dir, package,
+                                    'CMakeCache.txt'))
+
+
+def is_installed(area, package):
+    return os.path.exists(stamp_file(area, package, 'done'))
+
+
+def configure_command(area, package):
+    """Return the CMake command the superbuild would use to configure
+    package (cf ExternalProject's configure step)."""
+    with open(os.path.join(area.package_dir(package),
+                           configure_args_file), 'r') as f:
+        configure_args = json.load(f)
+    cmake = area.path(dev.spackdev_aux_bin_subdir, 'cmake')
+    return [cmake if os.path.exists(cmake) else 'cmake'] + \
+        configure_args['cmake_args'] + \
+        ['-G' + configure_args['cmake_generator'],
+         os.path.join(area.srcs_dir, package)]
+
+
+def mark_configured(area, package):
+    """Bring the superbuild's stamps for package up to date so that its
+    configure step is not repeated."""
+    mkdirp(os.path.dirname(stamp_file(area, package, 'configure')))
+    for step in _configure_steps:
+        with open(stamp_file(area, package, step), 'a'):
+            pass
+        os.utime(stamp_file(area, package, step), None)
+
+
+def configure_package(area, package):
+    build_dir = os.path.join(area.build_dir, package)
+    mkdirp(build_dir, os.path.join(area.install_dir, package))
+    apply_package_seed(area.base, package, build_dir)
+    result = run_in_package(package, configure_command(area, package),
+                            build_dir)
+    if result.succeeded:
+        mark_configured(area, package)
+    return result
+
+
+def configure_packages(packages=None, jobs=None, force=False):
+    """Configure packages (default all) concurrently, skipping those that
+    have already been configured (unless force) and those that depend on
+    other packages under development that have not yet been installed."""
+    area = current_area()
+    packages = selected_packages(area, packages)
+    dependencies = area.dev_package_dependencies()
+    if not force:
+        packages = [package for package in packages if
+                    not is_configured(area, package)]
+    output_lock = threading.Lock()
+
+    def task(package):
+        missing = [dep for dep in sorted(dependencies[package]) if
+                   not is_installed(area, dep)]
+        if missing:
+            return Package_result(package, None,
+                                  'requires installation of {0}\n'.
+                                  format(' '.join(missing)),
+                                  skipped=True)
+        return configure_package(area, package)
+
+    def callback(result):
+        with output_lock:
+            if result.succeeded:
+                result = Package_result(result.package, result.returncode,
+                                        '', result.seconds)
+            report_result(result)
+
+    if not packages:
+        tty.msg('nothing to configure')
+        return []
+    results = run_for_packages(packages, task, jobs or cpu_count(),
+                               callback=callback)
+    record_results(area, 'configure', results)
+    return results
+
+
+def configure(parser, args):
+    check_trees(current_area())
+    results = configure_packages(args.packages, args.jobs, args.force)
+    if results:
+        sys.exit(summarize_results(results))
@@ -3,20 +3,40 @@
 from __future__ import print_function
 
 import argparse
+import os
 
 from fnal.spack.dev.external_repo import External_repo
+import fnal.spack.dev.external_tools as external_tools
 from fnal.spack.dev.packages_yaml import Packages_yaml
 description = "search for system packages and add to packages.yaml"
 
 
 def setup_parser(subparser):
-    pass
+    subparser.add_argument('-j', '--jobs', type=int,
+                           help='number of probes to run concurrently (default: number of CPUs)')
+    subparser.add_argument('--refresh', action='store_true', default=False,
+                           help='ignore cached probe results and re-run all probes')
+    subparser.add_argument('--compile-probes', action='store_true',
+                           default=False, dest='compile_probes',
+                           help='always compile, link and run test programs to obtain the versions of libraries, rather than extracting them with the preprocessor')
+    subparser.add_argument('--scan-root', action='append', dest='scan_roots',
+                           metavar='ROOT',
+                           help='also look for externals in every installation prefix (directory with bin/ or include/) found under ROOT; may be repeated')
+    subparser.add_argument('--scan-depth', type=int, default=4,
+                           help='maximum depth below each scan root at which to look for installation prefixes (default 4)')
     # subparser.add_argument('pathname', nargs=argparse.REMAINDER,
     #                        help="pathname of SpackDev area")
     # subparser.add_argument('-s', '--no-stage', action='store_true', dest='no_stage',
     #     help="do not stage packages")
 
 def findext(parser, args):
-    external_repo = External_repo()
     packages_yaml = Packages_yaml()
-    packages_yaml.write_file(external_repo.all_external_packages())
+    external_tools.preprocess_probes = not args.compile_probes
+    probe_cache = external_tools.Probe_cache\
+        (os.path.join(os.path.dirname(packages_yaml.filename),
+                      'spackdev-findext-cache.json'),
+         refresh=args.refresh)
+    external_repo = External_repo(jobs=args.jobs, probe_cache=probe_cache,
+                                  scan_roots=args.scan_roots,
+                                  scan_depth=args.scan_depth)
+    packages_yaml.write_file(external_repo.all_found_external_packages())
@@ -0,0 +1,90 @@
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import threading
+
+from llnl.util import tty
+
+from fnal.spack.dev.area import current_area
+from fnal.spack.dev.runner import run_in_package, run_for_packages
+
+description = "run a command in the build environment of each (or selected) spackdev package, optionally in parallel"
+
+
+def setup_parser(subparser):
+    subparser.add_argument('-j', '--jobs', type=int, default=1,
+                           help='number of packages to process concurrently (default 1)')
+    subparser.add_argument('-o', '--ordered', action='store_true',
+                           default=False,
+                           help='start a package only after the packages under development on which it depends have completed successfully')
+    subparser.add_argument('-p', '--package', action='append',
+                           dest='packages', metavar='PACKAGE',
+                           help='restrict to PACKAGE (may be repeated; default is all packages)')
+    subparser.add_argument('--srcs', action='store_true', default=False,
+                           help='execute the command in srcs/<package> rather than build/<package>')
+    subparser.add_argument('cmd', nargs=argparse.REMAINDER,
+                           help='command and arguments to execute')
+
+
+def selected_packages(area, packages):
+    all_packages = area.dev_packages()
+    if not packages:
+        return all_packages
+    for package in packages:
+        if package not in all_packages:
+            tty.die("'{0}' is not in the list of SpackDev area packages ({1})"
+                    .format(package, all_packages))
+    return [package for package in all_packages if package in packages]
+
+
+def report_result(result):
+    if result.skipped:
+        tty.warn('{0}: {1}'.format(result.package, result.output.rstrip()))
+        return
+    header = '{0}: exit status {1} ({2:.1f} s)'.\
+             format(result.package, result.returncode, result.seconds)
+    if result.succeeded:
+        tty.msg(header)
+    else:
+        tty.error(header)
+    if result.output:
+        sys.stdout.write(result.output)
+        if not result.output.endswith('\n'):
+            sys.stdout.write('\n')
+    sys.stdout.flush()
+
+
+def summarize_results(results):
+    failed = [result.package for result in results if not result.succeeded]
+    if failed:
+        tty.error('{0} of {1} packages failed or were skipped: {2}'.
+                  format(len(failed), len(results), ' '.join(failed)))
+    else:
+        tty.msg('all {0} packages succeeded'.format(len(results)))
+    return 1 if failed else 0
+
+
+def foreach(parser, args):
+    if args.cmd and args.cmd[0] == '--':
+        args.cmd = args.cmd[1:]
+    if not args.cmd:
+        tty.die('foreach: no command specified')
+    area = current_area()
+    packages = selected_packages(area, args.packages)
+    output_lock = threading.Lock()
+
+    def task(package):
+        return run_in_package(package, args.cmd,
+                              os.path.join(area.srcs_dir if args.srcs else
+                                           area.build_dir, package))
+
+    def callback(result):
+        with output_lock:
+            report_result(result)
+
+    results = run_for_packages(packages, task, args.jobs,
+                               area.dev_package_dependencies() if
+                               args.ordered else None, callback)
+    sys.exit(summarize_results(results))
@@ -1,9 +1,20 @@
 import fnal.spack.dev.cmd as cmd
+from fnal.spack.dev.area import current_area
+from fnal.spack.dev.locks import metadata_lock
 
 description  = 'install missing dependencies of packages in a SpackDev area'
 
 def setup_parser(subparser):
-    pass
+    subparser.add_argument('--binary-cache', dest='binary_cache',
+                           help='install what dependencies we can from the binary packages in directory mirror BINARY_CACHE before building the rest from source (default: as specified to spack dev init)')
+    subparser.add_argument('--no-check-signature', action='store_true',
+                           dest='unsigned', default=False,
+                           help='do not check signatures of binary packages')
+    subparser.add_argument('-j', '--jobs', type=int,
+                           help='number of binary packages to extract concurrently (default: number of cores)')
 
 def getdeps(parser, args):
-    cmd.install_dependencies()
+    with metadata_lock(current_area().base).read():
+        cmd.install_dependencies(binary_cache=args.binary_cache,
+                                 jobs=args.jobs,
+                                 unsigned=args.unsigned)
@@ -5,18 +5,27 @@ import argparse
 from collections import deque
 import copy
 import exceptions
+import json
 import os
 import re
 import shutil
-import subprocess
 import sys
 
-import spack.hash_types as ht
 import spack.store  # For spack.store.root to replace SPACK_INSTALL
 
 import fnal.spack.dev as dev
 from fnal.spack.dev.cmd import DevPackageInfo
-from fnal.spack.dev.environment import sanitized_environment, srcs_topdir, load_environment
+from fnal.spack.dev.cmd.configure import configure_args_file, \
+    configure_packages
+from fnal.spack.dev.environment import sanitized_environment, srcs_topdir, load_environment, unquote, environment_from_pickle
+from fnal.spack.dev.locks import metadata_lock, environment_lock
+import fnal.spack.dev.metrics as metrics
+import fnal.spack.dev.partial_clone as partial_clone
+from fnal.spack.dev.tree_roots import tree_path, placed_root, remove_tree, \
+    place_trees, build_root_var, install_root_var
+from fnal.spack.dev.spec_store import Spec_store
+from fnal.spack.dev.cmake_seed import prepare_package_seed, \
+    apply_package_seed
 
 from llnl.util import tty
 from llnl.util import filesystem
@@ -78,8 +87,8 @@ class PathFixer:
     def __init__(self, spack_install, spack_stage):
         self.spack_install = spack_install
         self.spack_stage = spack_stage
-        self.spackdev_install = os.path.join(spackdev_base, 'install')
-        self.spackdev_stage = os.path.join(spackdev_base, 'build')
+        self.spackdev_install = tree_path(spackdev_base, 'install')
+        self.spackdev_stage = tree_path(spackdev_base, 'build')
 
     def set_packages(self, *args):
         # Sort package names by decreasing length to avoid problems with
@@ -104,7 +113,7 @@ class PathFixer:
         result = self.install_path_finder.sub(os.path.join(self.spackdev_install, r'\g<pkg>'), path)
         if 'build_directory' in kwargs:
             result = re.sub(r'(?:(?<=[=\s;:"\'])|^){0}'.format(kwargs['build_directory']),
-                            os.path.join(spackdev_base, 'build', kwargs.get('package_name', '')),
+                            os.path.join(self.spackdev_stage, kwargs.get('package_name', '')),
                             result)
         return result
 
@@ -127,6 +136,45 @@ def extract_specs(spec_source):
     return spack.concretize.concretize_specs_together(*specs)
 
 
+def hashes_from(sources):
+    hashes = []
+    for source in sources:
+        if os.path.isfile(source):
+            with open(source, 'r') as hash_file:
+                hashes.extend(hash_file.read().split())
+        else:
+            hashes.append(source)
+    return [dag_hash.lstrip('/') for dag_hash in hashes]
+
+
+def installed_specs(hashes):
+    # Load concrete specs from the store database rather than
+    # concretizing, insisting that together they describe a single
+    # consistent DAG as concretize_specs_together would.
+    specs = []
+    nodes = {}
+    with spack.store.db.read_transaction():
+        for dag_hash in hashes:
+            matches = spack.store.db.get_by_hash(dag_hash, installed=True)
+            if not matches:
+                tty.die('no installed spec matches hash /{0}'.
+                        format(dag_hash))
+            if len(matches) > 1:
+                tty.die('hash /{0} is ambiguous: it matches {1}'.
+                        format(dag_hash,
+                               ', '.join(spec.cshort_spec for spec in matches)))
+            spec = matches[0]
+            for node in spec.traverse():
+                other = nodes.setdefault(node.name, node)
+                if other.dag_hash() != node.dag_hash():
+                    tty.die('installed specs have inconsistent '
+                            'configurations of {0}: {1} and {2}'.
+                            format(node.name, other.cshort_spec,
+                                   node.cshort_spec))
+            specs.append(spec)
+    return specs
+
+
 def update_deps_with_deps_from(deps, new, specs, all_terminals):
     for tp in new:
         for spec in specs:
@@ -193,17 +241,35 @@ set_property(DIRECTORY PROPERTY EP_STEP_TARGETS
              configure build install test
   )
 '''.format(project,
-           os.path.join(spackdev_base, 'install'),
+           tree_path(spackdev_base, 'install'),
            srcs_topdir(),
-           os.path.join(spackdev_base, 'tmp')
+           tree_path(spackdev_base, 'tmp')
        ))
     return f
 
 
+# ExternalProject_Add() options for the test step by --test-step value.
+test_step_options = {
+    'before-install': 'TEST_BEFORE_INSTALL ON',
+    'after-install': 'TEST_AFTER_INSTALL ON',
+    'separate': 'TEST_EXCLUDE_FROM_MAIN ON'
+}
+
+
+def write_configure_args(package, cmake_args, cmake_generator):
+    dev.cmd.write_file_atomically\
+        (os.path.join(spackdev_base, dev.spackdev_aux_packages_subdir,
+                      package, configure_args_file),
+         json.dumps({'cmake_args': cmake_args,
+                     'cmake_generator': cmake_generator},
+                    indent=2) + '\n')
+
+
 gen_arg = re.compile(r'-G(.*)')
 def add_package_to_cmakelists(cmakelists, package, spec,
                               package_dependencies,
-                              cmake_args, build_system):
+                              cmake_args, build_system,
+                              test_step='before-install'):
 
     cmd_wrapper = lambda x : os.path.join(spackdev_base,
                                           dev.spackdev_aux_packages_subdir,
@@ -233,6 +299,9 @@ def add_package_to_cmakelists(cmakelists, package, spec,
             else:
                 filtered_cmake_args.append(arg)
 
+    # Record the arguments for spack dev configure.
+    write_configure_args(package, filtered_cmake_args, cmake_generator)
+
     cmake_args_string\
         = ' '.join([ '"{0}"'.format(arg) for arg in filtered_cmake_args])
 
@@ -245,7 +314,7 @@ file(MAKE_DIRECTORY ${{SPACKDEV_TMPDIR}}/{package})
 file(MAKE_DIRECTORY {package})
 
 ExternalProject_Add({package}
-  TEST_BEFORE_INSTALL ON
+  {test_step_option}
   TMP_DIR "${{SPACKDEV_TMPDIR}}/{package}"
   STAMP_DIR "${{SPACKDEV_TMPDIR}}/{package}/stamp"
   DOWNLOAD_DIR "${{SPACKDEV_TMPDIR}}/{package}"
@@ -262,6 +331,7 @@ ExternalProject_Add({package}
   DEPENDS {package_dependency_targets}
   )
 '''.format(package=package,
+           test_step_option=test_step_options[test_step],
            cmake_wrapper=cmd_wrapper('cmake'),
            ctest_wrapper=cmd_wrapper('ctest'),
            cmake_generator=cmake_generator,
@@ -307,8 +377,14 @@ def intersection(a, b):
 
 
 def write_cmakelists(dev_packages, dev_package_specs,
-                     build_system, path_fixer):
+                     build_system, path_fixer, test_step='before-install',
+                     initial_caches=None):
+    if initial_caches is None:
+        initial_caches = {}
     package_cmake_args = extract_cmake_args(dev_packages, dev_package_specs)
+    for dp, initial_cache in initial_caches.iteritems():
+        if initial_cache:
+            package_cmake_args[dp].insert(0, '-C{0}'.format(initial_cache))
     cmakelists = init_cmakelists()
     remaining_packages = copy.copy(dev_packages)
     while remaining_packages != []:
@@ -330,7 +406,7 @@ def write_cmakelists(dev_packages, dev_package_specs,
                 add_package_to_cmakelists(cmakelists, dp, spec,
                                           package_dependencies,
                                           package_cmake_args[dp],
-                                          build_system)
+                                          build_system, test_step)
                 remaining_packages.remove(dp)
 
 
@@ -425,43 +501,243 @@ def get_environment(spec):
         environment = os.environ.copy()
     # This needs to be what we want it to be.
     if 'SPACK_PREFIX' in environment:
-        environment['SPACK_PREFIX'] = os.path.join(spackdev_base, 'install')
+        environment['SPACK_PREFIX'] = tree_path(spackdev_base, 'install')
     return sanitized_environment(environment, drop_unchanged=True)
 
 
-def copy_modified_script(source, dest, environment):
-    infile = open(source, 'r')
-    outfile = open(dest, 'w')
+# Select the per-package configuration for the shared compiler wrapper
+# from the directory through which it was invoked
+# (spackdev-aux/packages/<package>/bin), falling back to
+# SPACKDEV_PACKAGE for direct invocations.
+_compiler_wrapper_prologue = '''
+# begin SpackDev configuration
+spackdev_config="${{0%/*}}/../env/{config}"
+if [ ! -r "$spackdev_config" ]; then
+  spackdev_config="${{SPACKDEV_BASE:-{base}}}/{packages_dir}/${{SPACKDEV_PACKAGE}}/env/{config}"
+fi
+if [ ! -r "$spackdev_config" ]; then
+  echo "SpackDev: unable to find compiler wrapper configuration for $0 (set SPACKDEV_PACKAGE?)" 1>&2
+  exit 1
+fi
+. "$spackdev_config"
+# end SpackDev configuration
 
-    # copy hash bang line
-    line = infile.readline()
-    outfile.write(line)
+'''
+
+compiler_wrapper_config = 'compiler-wrapper.sh'
+
+# Fast wrappers apply flag sets precomputed at init time rather than
+# having Spack's wrapper re-derive them from SPACK_* for every
+# invocation.
+_fast_compiler_wrapper = '''#!/bin/bash
+# SpackDev fast compiler wrapper ({lang}).
+{prologue}
+mode=ccld
+for arg in "$@"; do
+  case "$arg" in
+    -v|-V|--version|-dumpversion|-dumpfullversion)
+      exec "${{spackdev_{lang}_compiler[@]}}" "$@" ;;
+    -E|-M|-MM)
+      mode=cpp ;;
+    -c|-S)
+      [ "$mode" = ccld ] && mode=cc ;;
+  esac
+done
+case "$mode" in
+  cpp)
+    exec "${{spackdev_{lang}_compiler[@]}}" "${{spackdev_{lang}_cppflags[@]}}" \\
+      "$@" "${{spackdev_{lang}_include_dirs[@]}}" ;;
+  cc)
+    exec "${{spackdev_compiler_launcher[@]}}" \\
+      "${{spackdev_{lang}_compiler[@]}}" "${{spackdev_{lang}_flags[@]}}" \\
+      "$@" "${{spackdev_{lang}_include_dirs[@]}}" ;;
+  *)
+    exec "${{spackdev_{lang}_compiler[@]}}" "${{spackdev_{lang}_flags[@]}}" \\
+      "$@" "${{spackdev_{lang}_include_dirs[@]}}" \\
+      "${{spackdev_{lang}_link_flags[@]}}" "${{spackdev_{lang}_libs[@]}}" ;;
+esac
+'''
 
-    # insert select variables
-    outfile.write('\n# begin SpackDev variables\n')
+compiler_wrapper_modes = ('spack', 'fast')
+
+compiler_cache_tools = ('ccache', 'sccache')
+compiler_cache_statslog = 'compiler-cache-stats.log'
+
+_compiler_vars = ('CC', 'CXX', 'F77', 'FC')
+_compiler_flags_vars = {'CC': 'SPACK_CFLAGS',
+                        'CXX': 'SPACK_CXXFLAGS',
+                        'F77': 'SPACK_FFLAGS',
+                        'FC': 'SPACK_FFLAGS'}
+
+
+def shared_compiler_wrappers_dir(mode='spack'):
+    return os.path.join(spackdev_base, dev.spackdev_aux_wrappers_subdir,
+                        mode)
+
+
+def _compiler_wrapper_prologue_for_area():
+    return _compiler_wrapper_prologue.format\
+        (config=compiler_wrapper_config,
+         base=spackdev_base,
+         packages_dir=dev.spackdev_aux_packages_subdir)
+
+
+def create_shared_compiler_wrapper(source, name):
+    """Install a single shared copy of Spack's compiler wrapper script,
+    modified to read its SpackDev configuration at run time, and return
+    the path of a link to it called name."""
+    shared_dir = shared_compiler_wrappers_dir()
+    script = os.path.basename(os.path.realpath(source))
+    dest = os.path.join(shared_dir, script)
+    if not os.path.exists(dest):
+        filesystem.mkdirp(shared_dir)
+        with open(os.path.realpath(source), 'r') as infile:
+            # copy hash bang line
+            contents = [infile.readline(),
+                        _compiler_wrapper_prologue_for_area()]
+            # copy the rest
+            contents.extend(infile.readlines())
+        dev.cmd.write_file_atomically(dest, ''.join(contents), 0o755)
+    link = os.path.join(shared_dir, name)
+    if not os.path.lexists(link):
+        os.symlink(script, link)
+    return link
+
+
+def create_fast_compiler_wrapper(lang, name):
+    """Install the shared fast compiler wrapper for language variable
+    lang (CC, CXX, F77 or FC) under the given name, and return its
+    path."""
+    dest = os.path.join(shared_compiler_wrappers_dir('fast'), name)
+    if not os.path.exists(dest):
+        dev.cmd.write_file_atomically\
+            (dest,
+             _fast_compiler_wrapper.format
+             (lang=lang, prologue=_compiler_wrapper_prologue_for_area()),
+             0o755)
+    return dest
+
+
+def fast_compiler_flags(lang, environment):
+    """Precompute the compiler, flags, include directories and link
+    arguments Spack's compiler wrapper would add for language variable
+    lang, as a dictionary of argument lists."""
+    def value_of(var):
+        return unquote(environment.get(var, ''))
+
+    def dirs_of(var):
+        return [d for d in value_of(var).split(':') if d]
+
+    include_dirs = dirs_of('SPACK_INCLUDE_DIRS')
+    link_dirs = dirs_of('SPACK_LINK_DIRS')
+    rpath_dirs = dirs_of('SPACK_RPATH_DIRS')
+    if not (include_dirs or link_dirs or rpath_dirs):
+        # Older Spack: derive directories from the dependency prefixes.
+        for dep in dirs_of('SPACK_DEPENDENCIES'):
+            include_dirs.append(os.path.join(dep, 'include'))
+            for libdir in ('lib', 'lib64'):
+                link_dirs.append(os.path.join(dep, libdir))
+                rpath_dirs.append(os.path.join(dep, libdir))
+    if value_of('SPACK_PREFIX'):
+        rpath_dirs.extend([os.path.join(value_of('SPACK_PREFIX'), libdir)
+                           for libdir in ('lib', 'lib64')])
+
+    rpath_arg = value_of('SPACK_{0}_RPATH_ARG'.format(lang)) or '-Wl,-rpath,'
+    link_flags = value_of('SPACK_LDFLAGS').split() + \
+                 ['-L' + d for d in link_dirs] + \
+                 [rpath_arg + d for d in rpath_dirs]
+    if value_of('SPACK_DTAGS_TO_ADD'):
+        link_flags.append((value_of('SPACK_LINKER_ARG') or '-Wl,') +
+                          value_of('SPACK_DTAGS_TO_ADD'))
+    cppflags = value_of('SPACK_CPPFLAGS').split()
+    return {'compiler': [value_of('SPACK_{0}'.format(lang))],
+            'cppflags': cppflags,
+            'flags': value_of('SPACK_TARGET_ARGS').split() + cppflags +
+            value_of(_compiler_flags_vars[lang]).split(),
+            'include_dirs': ['-I' + d for d in include_dirs],
+            'link_flags': link_flags,
+            'libs': value_of('SPACK_LDLIBS').split()}
+
+
+def compiler_cache_settings(env_dir):
+    """Return the variables to be set by compiler wrappers to use the
+    compiler cache selected at init time (if any), with the launcher
+    prefix for the fast wrappers."""
+    tool = os.environ.get('SPACKDEV_COMPILER_CACHE')
+    if not tool:
+        return {}, []
+    cache_dir = os.environ['SPACKDEV_COMPILER_CACHE_DIR']
+    # Spack's wrapper (0.15 onward) invokes the compiler via
+    # SPACK_CCACHE_BINARY when compiling.
+    settings = {'SPACK_CCACHE_BINARY': tool}
+    if os.path.basename(tool).startswith('sccache'):
+        settings['SCCACHE_DIR'] = cache_dir
+    else:
+        # Hash paths within the area relative to its top so that
+        # objects may be shared between areas (and are not invalidated
+        # by relocating one); no rpaths are passed when compiling.
+        settings.update({'CCACHE_DIR': cache_dir,
+                         'CCACHE_BASEDIR': spackdev_base,
+                         'CCACHE_NOHASHDIR': 'true',
+                         'CCACHE_STATSLOG':
+                         os.path.join(spackdev_base, env_dir,
+                                      compiler_cache_statslog)})
+    return settings, [tool]
+
+
+def write_compiler_wrapper_config(config_file, environment, langs):
+    contents = ['# SpackDev compiler wrapper configuration\n']
     for var, value in sorted(environment.iteritems()):
         if var in ['CMAKE_PREFIX_PATH', 'PATH'] or re.match('^SPACK_.*', var):
-            outfile.write('{0}\n'.format(env_var_to_source_line(var, value)))
-    outfile.write('# end SpackDev variables\n\n')
-
-    # copy the rest
-    for line in infile.readlines():
-        outfile.write(line)
-    outfile.close()
-    os.chmod(dest, 0755)
-
-
-def create_package_compiler_wrappers(wrappers_dir, environment):
+            contents.append('{0}\n'.format(env_var_to_source_line(var, value)))
+    (cache_settings, launcher)\
+        = compiler_cache_settings(os.path.dirname(config_file))
+    if cache_settings:
+        contents.append('\n# Compiler cache.\n')
+        for var, value in sorted(cache_settings.iteritems()):
+            contents.append('{0}\n'.format(env_var_to_source_line(var, value)))
+    if metrics.enabled():
+        contents.append('\n# Count invocations for metrics.\n')
+        contents.append('printf . >> {0} 2>/dev/null\n'.format
+                        (cmd_quote(os.path.join(spackdev_base,
+                                                os.path.dirname(config_file),
+                                                metrics.wrapper_calls_file))))
+    contents.append('\n# Precomputed arguments for fast wrappers.\n')
+    contents.append('spackdev_compiler_launcher=({0})\n'.
+                    format(' '.join([cmd_quote(arg) for arg in launcher])))
+    for lang in langs:
+        for key, args in sorted(fast_compiler_flags(lang, environment).
+                                iteritems()):
+            contents.append('spackdev_{0}_{1}=({2})\n'.
+                            format(lang, key,
+                                   ' '.join([cmd_quote(arg) for arg in args])))
+    dev.cmd.write_file_atomically(config_file, ''.join(contents))
+
+
+def create_package_compiler_wrappers(wrappers_dir, env_dir, environment,
+                                     mode='spack'):
+    langs = []
     for var, value in sorted(environment.iteritems()):
-        if var in ['CC', 'CXX', 'F77', 'FC']:
-            if value[0] == "'" and value[-1] == "'":
-                # It's been quoted: we need the shell to unquote it.
-                value=subprocess.call("echo {0}".format(value), shell=True)
+        if var in _compiler_vars:
+            value = unquote(value)
             filename = os.path.basename(value)
             dest = os.path.join(wrappers_dir, filename)
+            # Both flavors of shared wrapper are always available, so
+            # they may be compared (cf spack dev wrapper-bench).
+            shared_wrappers = \
+                {'spack': create_shared_compiler_wrapper(value, filename),
+                 'fast': create_fast_compiler_wrapper(var, filename)}
+            if not os.path.lexists(dest):
+                os.symlink(os.path.relpath(shared_wrappers[mode],
+                                           os.path.join(spackdev_base,
+                                                        wrappers_dir)),
+                           dest)
             environment[var]\
                 = os.path.join(spackdev_base, dest)
-            copy_modified_script(value, dest, environment)
+            langs.append(var)
+    write_compiler_wrapper_config(os.path.join(env_dir,
+                                               compiler_wrapper_config),
+                                  environment, langs)
 
 
 def create_package_cmd_wrappers(package, package_wrappers_dir,
@@ -491,11 +767,15 @@ def create_cmd_links(specs):
     return wrappers_dir
 
 
-def create_package_wrappers(package, global_wrappers_dir, environment):
+def create_package_wrappers(package, global_wrappers_dir, environment,
+                            wrapper_mode):
     package_wrappers_dir\
         = os.path.join(dev.spackdev_aux_packages_subdir, package, 'bin')
     filesystem.mkdirp(package_wrappers_dir)
-    create_package_compiler_wrappers(package_wrappers_dir, environment)
+    create_package_compiler_wrappers(package_wrappers_dir,
+                                     os.path.join(dev.spackdev_aux_packages_subdir,
+                                                  package, 'env'),
+                                     environment, wrapper_mode)
     create_package_cmd_wrappers(package, package_wrappers_dir,
                                 global_wrappers_dir)
 
@@ -512,7 +792,8 @@ def create_env_files(env_dir, environment):
     pickle_environment(os.path.join(env_dir, 'env.pickle'), environment)
 
 
-def create_environment(dev_packages, dev_package_specs, path_fixer, global_wrappers_dir):
+def create_environment(dev_packages, dev_package_specs, path_fixer,
+                       global_wrappers_dir, wrapper_mode='spack'):
     for dp in dev_packages:
         tty.msg('creating environment for {0}'.format(dp))
         package_spec = dev_package_specs[dp]
@@ -524,11 +805,30 @@ def create_environment(dev_packages, dev_package_specs, path_fixer, global_wrapp
                                    build_directory=build_directory_for(package_spec.package),
                                    package_name=dp)) for var, val in
                    environment.iteritems())
-        create_package_wrappers(dp, global_wrappers_dir, environment)
-        create_env_files(os.path.join(dev.spackdev_aux_packages_subdir, dp, 'env'), environment)
+        with environment_lock(spackdev_base, dp).write():
+            create_package_wrappers(dp, global_wrappers_dir, environment,
+                                    wrapper_mode)
+            create_env_files(os.path.join(dev.spackdev_aux_packages_subdir, dp, 'env'), environment)
     create_env_files(dev.spackdev_aux_env_subdir, sanitized_environment(os.environ))
 
 
+def seed_cmake_detection(dev_packages, global_wrappers_dir, build_system):
+    """Prepare the shared results of CMake's compiler detection for each
+    package, returning the initial cache file (if any) by package."""
+    cmake = os.path.join(global_wrappers_dir, 'cmake')
+    if not os.path.exists(cmake):
+        cmake = which('cmake')
+    initial_caches = {}
+    for dp in dev_packages:
+        environment = environment_from_pickle\
+            (os.path.join(spackdev_base, dev.spackdev_aux_packages_subdir,
+                          dp, 'env', 'env.pickle'))
+        initial_caches[dp]\
+            = prepare_package_seed(spackdev_base, dp, environment, cmake,
+                                   build_system.cmake_generator)
+    return initial_caches
+
+
 def write_package_info(requested, additional,
                        requested_dev_package_info,
                        additional_dev_package_info,
@@ -568,14 +868,9 @@ def write_package_info(requested, additional,
                           dp in additional_dev_package_info]) + '\n')
         f.write(' '.join([dep.name for dep in dep_specs]) + '\n')
 
-    # Write spec YAML.
-    spec_dir = os.path.join(spackdev_base, dev.spackdev_aux_specs_subdir)
-    filesystem.mkdirp(spec_dir)
-
-    for dep in specs:
-        with open(os.path.join(spec_dir, '{0}.yaml'.format(dep.name)), 'w') \
-             as f:
-            dep.to_yaml(stream=f, hash=ht.build_hash)
+    # Write specs.
+    Spec_store(os.path.join(spackdev_base,
+                            dev.spackdev_aux_spec_store_subdir)).write(specs)
 
     return dep_specs
 
@@ -584,7 +879,8 @@ cmake = spack.util.executable.Executable('cmake')
 
 
 def init_build_area(build_system, args):
-    os.mkdir('build')
+    # May be a link to the build root.
+    filesystem.mkdirp('build')
     os.chdir('build')
     cmd_args = [ '../srcs',
                  '-G',
@@ -605,7 +901,7 @@ when you have addressed any problems.'''.
                          status=cmake.returncode,
                          env=cmd_quote(os.path.join(spackdev_base,
                                                     dev.spackdev_aux_subdir, 'env.sh')),
-                         build_dir=cmd_quote(os.path.join(spackdev_base, 'build')),
+                         build_dir=cmd_quote(tree_path(spackdev_base, 'build')),
                          cmd=' '.join([cmd_quote(x) for x in
                                        [cmake.name] + cmd_args])))
         if args.no_stage and 'No download info given' in e.long_message:
@@ -624,6 +920,13 @@ def setup_parser(subparser):
                                help='packages and dependencies should be inferred '
                                'from the list specified in this text file (in '
                                '"spack install" format)')
+    package_group.add_argument('--from-hash', dest='from_hash',
+                               action='append', metavar='HASH',
+                               help='take packages and dependencies from the '
+                               'installed spec with this (possibly '
+                               'abbreviated) hash, without concretizing; '
+                               'HASH may also be a file of hashes (may be '
+                               'repeated)')
     # Default branch / tag options.
     defgroup = package_group.add_mutually_exclusive_group()
     defgroup.add_argument('--default-branch', dest='default_branch', default='develop',
@@ -651,6 +954,22 @@ def setup_parser(subparser):
                             dest='no_stage',
                             help='do not stage packages for development')
 
+    # Clone options.
+    clone_group = subparser.add_argument_group\
+                  ('clone control',
+                   'Limit what is cloned when staging git packages for '
+                   'development (also used by spack dev stage; cf spack dev '
+                   'unshallow).')
+    clone_group.add_argument('--clone-depth', dest='clone_depth', type=int,
+                             metavar='DEPTH',
+                             help='clone only the last DEPTH commits of the '
+                             'requested branch or tag')
+    clone_group.add_argument('--clone-filter', dest='clone_filter',
+                             metavar='FILTER',
+                             help='make a partial clone with this object '
+                             'filter, e.g. blob:none to fetch file contents '
+                             'only as they are needed')
+
 
     # Generator control options.
     gengroup\
@@ -677,6 +996,88 @@ def setup_parser(subparser):
                           'automatically use the selected generator '
                           'regardless of this setting.')
 
+    # Compiler wrapper options.
+    subparser.add_argument('--compiler-wrappers', dest='compiler_wrappers',
+                           choices=compiler_wrapper_modes, default='spack',
+                           help='Compiler wrappers for packages under '
+                           'development: "spack" (Spack\'s own wrapper, '
+                           'default) or "fast" (apply flags precomputed at '
+                           'init time with minimal per-invocation overhead)')
+
+    # CMake detection seeding.
+    subparser.add_argument('--seed-cmake', action='store_true',
+                           dest='seed_cmake', default=False,
+                           help='Carry out CMake\'s compiler and platform '
+                           'detection once per distinct compiler and seed '
+                           'the results into the configuration of each '
+                           'package under development')
+
+    # Test step.
+    subparser.add_argument('--test-step', dest='test_step',
+                           choices=sorted(test_step_options.keys()),
+                           default='before-install',
+                           help='When the superbuild runs the tests of each '
+                           'package: "before-install" (default), '
+                           '"after-install", or "separate" (only via the '
+                           '<package>-test targets or spack dev test, keeping '
+                           'tests out of the critical path of an incremental '
+                           'build)')
+
+    # Binary cache options.
+    subparser.add_argument('--binary-cache', dest='binary_cache',
+                           help='Install what dependencies we can from the '
+                           'binary packages in directory mirror BINARY_CACHE '
+                           'before building the rest from source (also used '
+                           'by spack dev getdeps)')
+    subparser.add_argument('--no-check-signature', action='store_true',
+                           dest='unsigned', default=False,
+                           help='Do not check signatures of binary packages')
+
+    # Compiler cache options.
+    subparser.add_argument('--compiler-cache', dest='compiler_cache',
+                           choices=compiler_cache_tools,
+                           help='Use the specified compiler cache when '
+                           'compiling packages under development (with '
+                           '--compiler-wrappers spack, requires Spack 0.15 or '
+                           'later; the fast wrappers invoke the cache '
+                           'directly with any Spack version)')
+    subparser.add_argument('--compiler-cache-dir', dest='compiler_cache_dir',
+                           help='Directory for the compiler cache (default: '
+                           'spackdev-aux/compiler-cache in the SpackDev area; '
+                           'specify a per-user directory to share cached '
+                           'objects between areas)')
+
+    # Pre-configure option.
+    subparser.add_argument('--configure', dest='configure', type=int,
+                           nargs='?', const=0, metavar='JOBS',
+                           help='Configure packages under development '
+                           'concurrently (JOBS at a time, default number of '
+                           'cores) at the end of initialization rather than '
+                           'serially during the first build (cf spack dev '
+                           'configure). Only packages that depend on no other '
+                           'package under development can be configured '
+                           'now; the rest are configured by the superbuild '
+                           'or by spack dev configure once their '
+                           'dependencies are installed')
+
+    # Metrics option.
+    subparser.add_argument('--metrics-file', dest='metrics_file',
+                           help='Record metrics (phase and step durations, '
+                           'staging sizes, dependency and compiler wrapper '
+                           'counts) for this and subsequent operations in '
+                           'the area in METRICS_FILE, in Prometheus text '
+                           'format (e.g. a .prom file in the directory of '
+                           'node_exporter\'s textfile collector)')
+
+    # Tree placement options.
+    subparser.add_argument('--build-root', dest='build_root',
+                           help='Place the build and tmp trees of the area '
+                           'under BUILD_ROOT (e.g. node-local scratch or '
+                           'tmpfs), with links from the area')
+    subparser.add_argument('--install-root', dest='install_root',
+                           help='Place the install tree of the area under '
+                           'INSTALL_ROOT, with a link from the area')
+
     # Other options.
     subparser.add_argument('-b', '--base-dir', dest='base_dir',
                            help='Specify base directory to use instead of current working directory')
@@ -689,6 +1090,9 @@ def setup_parser(subparser):
                            dest='print_spec_tree',
                            const='exit',
                            help='Print the full calculated spec tree(s)---cf spack spec -It---and then exit')
+    subparser.add_argument('--spec-tree-json', dest='spec_tree_json',
+                           metavar='FILE',
+                           help='With -p or -P, write the spec tree(s) as JSON to FILE instead of printing them')
     subparser.add_argument('-v', '--verbose', action='store_true',
                            help='provide more helpful output')
 
@@ -720,6 +1124,20 @@ def default_version_info_from_args(args):
          'tag_or_branch': args.default_branch}
 
 
+def init_compiler_cache(args):
+    tool = which(args.compiler_cache)
+    if not tool:
+        tty.die('spack dev init: unable to find {0} in PATH for --compiler-cache'
+                .format(args.compiler_cache))
+    cache_dir = args.compiler_cache_dir or \
+                os.path.join(spackdev_base, dev.spackdev_aux_subdir,
+                             'compiler-cache')
+    filesystem.mkdirp(cache_dir)
+    # Save for posterity.
+    os.environ['SPACKDEV_COMPILER_CACHE'] = tool
+    os.environ['SPACKDEV_COMPILER_CACHE_DIR'] = cache_dir
+
+
 def init_spackdev_base(args):
     global spackdev_base
     # Sanity checks.
@@ -748,30 +1166,54 @@ def init_spackdev_base(args):
         tty.die('spack dev init: unable to make or change directory to {0}'
                 .format(spackdev_base))
 
+    locked = args.resume
     if args.resume:
         if not (os.path.exists(dev.spackdev_aux_packages_sd_file) and
-                os.path.exists(dev.spackdev_aux_specs_subdir)):
+                (os.path.exists(dev.spackdev_aux_spec_store_subdir) or
+                 os.path.exists(dev.spackdev_aux_specs_subdir))):
             _init_subparser.error('--resume specified, but required '
                                   'packages.sd and spec files missing: redo from start')
+        # Held until we exit.
+        metadata_lock(spackdev_base).acquire_write()
+        # Keep trees where they were unless told otherwise.
+        args.build_root = args.build_root or \
+            placed_root(spackdev_base, 'build')
+        args.install_root = args.install_root or \
+            placed_root(spackdev_base, 'install')
         tty.debug('cleaning incomplete SpackDev installation files')
-        for wd in ('build', 'install', 'tmp',
-                   dev.spackdev_aux_bin_subdir,
+        for wd in ('build', 'install', 'tmp'):
+            remove_tree(spackdev_base, wd)
+        for wd in (dev.spackdev_aux_bin_subdir,
                    dev.spackdev_aux_env_subdir,
-                   dev.spackdev_aux_packages_subdir):
+                   dev.spackdev_aux_packages_subdir,
+                   dev.spackdev_aux_wrappers_subdir):
             shutil.rmtree(wd, ignore_errors=True)
     elif os.listdir(spackdev_base):
         if args.force:
             tty.info('spack dev init: (force) using non-empty directory {0}'
                      .format(spackdev_base))
             if (os.path.exists('spackdev-aux') or
-                os.path.exists('build') or
-                os.path.exists('install') or
-                os.path.exists('tmp')):
+                os.path.lexists('build') or
+                os.path.lexists('install') or
+                os.path.lexists('tmp')):
                 if args.force:
                     tty.info('spack dev init: (force) removing existing spackdev-aux, build and install directories from {0}'
                              .format(spackdev_base))
-                    for wd in ('spackdev-aux', 'build', 'install', 'tmp'):
-                        shutil.rmtree(wd, ignore_errors=True)
+                    # Held until we exit. Taken before anything is
+                    # removed, so the lock files are kept.
+                    metadata_lock(spackdev_base).acquire_write()
+                    locked = True
+                    for wd in os.listdir('spackdev-aux') \
+                            if os.path.isdir('spackdev-aux') else ():
+                        path = os.path.join('spackdev-aux', wd)
+                        if path == dev.spackdev_aux_locks_subdir:
+                            continue
+                        if os.path.isdir(path) and not os.path.islink(path):
+                            shutil.rmtree(path, ignore_errors=True)
+                        else:
+                            os.remove(path)
+                    for wd in ('build', 'install', 'tmp'):
+                        remove_tree(spackdev_base, wd)
                 else:
                     tty.die('spack dev init: cannot re-init (spackdev-aux/build/install/tmp directories exist)')
         else:
@@ -780,40 +1222,119 @@ def init_spackdev_base(args):
 
     # Save for posterity.
     os.environ['SPACKDEV_BASE'] = spackdev_base
+    if args.binary_cache:
+        os.environ['SPACKDEV_BINARY_CACHE'] = args.binary_cache
+    if args.metrics_file:
+        os.environ[metrics.metrics_file_var] = args.metrics_file
+    if args.clone_depth:
+        os.environ[partial_clone.clone_depth_var] = str(args.clone_depth)
+    if args.clone_filter:
+        os.environ[partial_clone.clone_filter_var] = args.clone_filter
+    if args.build_root:
+        os.environ[build_root_var] = args.build_root
+    if args.install_root:
+        os.environ[install_root_var] = args.install_root
 
     # Make necessary subdirectories.
     filesystem.mkdirp('spackdev-aux')
     filesystem.mkdirp('srcs')
 
+    if not locked:
+        # Held until we exit.
+        metadata_lock(spackdev_base).acquire_write()
 
-def print_spec_tree(dev_packages, specs):
-    # Print the minimum number of spec trees starting with a package
-    # for development such that all packages for development
-    # (including additional ones) are shown in at least one tree.
-    spec_names_to_print = set()
-    specs_to_print_dict = {}
-    all_to_print = set()
+    place_trees(spackdev_base, args.build_root, args.install_root)
+
+
+spec_tree_format = '{name}{@version}{%compiler}{compiler_flags}{variants}{arch=architecture}'
+
+
+def spec_tree_roots(dev_packages, specs):
+    # Find the minimum number of spec trees starting with a package for
+    # development such that all packages for development (including
+    # additional ones) are shown in at least one tree, i.e. those
+    # packages on which no other package for development depends. A
+    # single post-order pass records the development packages below each
+    # node.
+    dev_set = set(dev_packages)
+    nodes = {}
+    dev_below = {}
     for spec in specs:
-        for p in dev_packages:
-            if p in spec and p not in all_to_print:
-                flat_dependencies = spec[p].flat_dependencies().keys()
-                # Print the largest tree(s) only, avoiding
-                # duplication of development packages.
-                spec_names_to_print.difference_update(flat_dependencies)
-                all_to_print.update(flat_dependencies)
-                spec_names_to_print.add(p)
-                specs_to_print_dict[p] = spec[p]
+        for node in spec.traverse(order='post'):
+            if node.name in dev_below:
+                continue
+            below = set()
+            for dep in node.dependencies():
+                below.update(dev_below[dep.name])
+                if dep.name in dev_set:
+                    below.add(dep.name)
+            nodes[node.name] = node
+            dev_below[node.name] = below
+    covered = set()
+    for package in dev_packages:
+        covered.update(dev_below.get(package, ()))
+    return [nodes[package] for package in dev_packages if
+            package in nodes and package not in covered]
+
+
+def install_statuses(roots):
+    """Return the install status of each node of the given spec trees,
+    by DAG hash, looked up in a single read transaction of the store
+    database."""
+    statuses = {}
+    with spack.store.db.read_transaction():
+        for root in roots:
+            for node in root.traverse():
+                dag_hash = node.dag_hash()
+                if dag_hash not in statuses:
+                    statuses[dag_hash] = node.install_status()
+    return statuses
+
+
+def spec_tree_json(roots, dev_packages, statuses):
+    trees = []
+    for root in roots:
+        nodes = []
+        for node in root.traverse():
+            dag_hash = node.dag_hash()
+            nodes.append({
+                'name': node.name,
+                'hash': dag_hash,
+                'spec': node.format(spec_tree_format),
+                'development': node.name in dev_packages,
+                'installed': statuses.get(dag_hash),
+                'dependencies':
+                [{'name': name,
+                  'hash': dep.spec.dag_hash(),
+                  'types': sorted(dep.deptypes)}
+                 for name, dep in sorted(node.dependencies_dict().items())]})
+        trees.append({'root': root.name, 'nodes': nodes})
+    return trees
+
+
+def print_spec_tree(dev_packages, specs, json_file=None):
+    roots = spec_tree_roots(dev_packages, specs)
+    statuses = install_statuses(roots)
+    if json_file:
+        # Not standard output, which has our messages.
+        dev.cmd.write_file_atomically\
+            (json_file,
+             json.dumps(spec_tree_json(roots, dev_packages, statuses),
+                        indent=2, sort_keys=True) + '\n')
+        tty.msg('spec trees written to {0}'.format(json_file))
+        return
     tty.msg('Development package spec trees: \n{0}'.\
             format('\n'.join([spec.tree(cover='nodes',
-                                        format='{name}{@version}{%compiler}{compiler_flags}{variants}{arch=architecture}',
+                                        format=spec_tree_format,
                                         hashlen=7,
                                         show_types=True,
-                                        status_fn=spack.spec.Spec.install_status)
-                              for spec in [specs_to_print_dict[p] for p in spec_names_to_print]])))
+                                        status_fn=lambda node:
+                                        statuses.get(node.dag_hash()))
+                              for spec in roots])))
 
 
 def get_package_info(args):
-    dag_filename = None
+    spec_source = None
     if args.resume:
         tty.msg('resuming an incomplete SpackDev initialization')
         (requested_info, additional_info, deps, specs) = dev.cmd.read_package_info()
@@ -833,8 +1354,14 @@ def get_package_info(args):
 
         # Construct the concretized spec tree and identify additional
         # packages for checkout.
-        dag_filename = args.dag_file
-        specs = extract_specs(dag_filename if dag_filename else requested)
+        if args.from_hash:
+            spec_source = 'installed specs {0}'.\
+                          format(' '.join('/' + dag_hash[:7]
+                                          for dag_hash in args.from_hash))
+            specs = installed_specs(args.from_hash)
+        else:
+            spec_source = args.dag_file
+            specs = extract_specs(spec_source if spec_source else requested)
         additional = get_additional(requested, specs)
         additional_dev_package_info\
             = [DevPackageInfo(a, default_info=default_version_info)
@@ -853,8 +1380,8 @@ def get_package_info(args):
     # Report what we're doing.
     tty.msg('requested packages: {0}{1}'.\
             format(', '.join(requested),
-                   ' from install tree as specified in {0}'.format(dag_filename)
-                   if dag_filename else ''))
+                   ' from install tree as specified in {0}'.format(spec_source)
+                   if spec_source else ''))
     if additional:
         tty.msg('additional inter-dependent packages: ' +
                 ' '.join(additional))
@@ -870,8 +1397,27 @@ def init(parser, args):
 
     # Non-trivial exclusivity checks
     if args.resume:
-        if args.packages or args.dag_file:
-            _init_subparser.error('--resume is incompatible with --dag-file or non-option arguments PACKAGES')
+        if args.packages or args.dag_file or args.from_hash:
+            _init_subparser.error('--resume is incompatible with --dag-file, --from-hash or non-option arguments PACKAGES')
+    elif args.from_hash:
+        if args.dag_file:
+            _init_subparser.error('--from-hash is incompatible with --dag-file')
+        if not args.packages:
+            _init_subparser.error('--from-hash requires non-option arguments PACKAGES')
+    if args.spec_tree_json and not args.print_spec_tree:
+        _init_subparser.error('--spec-tree-json requires -p or -P')
+
+    # Interpret directory options relative to the invoking directory.
+    for opt in ('binary_cache', 'compiler_cache_dir', 'metrics_file',
+                'spec_tree_json', 'build_root', 'install_root'):
+        if getattr(args, opt):
+            setattr(args, opt,
+                    os.path.abspath(os.path.expanduser(getattr(args, opt))))
+    if args.from_hash:
+        # Read any files of hashes now, likewise.
+        args.from_hash = hashes_from(args.from_hash)
+
+    timer = metrics.Phase_timer()
 
     # Initialize the spack dev area.
     init_spackdev_base(args)
@@ -881,8 +1427,9 @@ def init(parser, args):
     build_system = Build_system(args.generator, args.override_generator)
     os.environ['SPACKDEV_GENERATOR'] = build_system.cmake_generator
 
-    (requested, additional, dev_package_info, specs, dep_specs)\
-        = get_package_info(args)
+    with timer.phase('concretize'):
+        (requested, additional, dev_package_info, specs, dep_specs)\
+            = get_package_info(args)
 
     dev_packages = requested + additional
 
@@ -901,14 +1448,15 @@ def init(parser, args):
 
     # Print development package spec tree(s) if desired.
     if args.print_spec_tree:
-        print_spec_tree(dev_packages, specs)
+        print_spec_tree(dev_packages, specs, args.spec_tree_json)
         if args.print_spec_tree == 'exit':
             sys.exit(1)
 
     # Stage development packages if selected.
     if not args.no_stage:
         tty.msg('stage sources for {0}'.format(dev_packages))
-        dev.cmd.stage_packages(dev_package_info, dev_package_specs)
+        with timer.phase('stage'):
+            dev.cmd.stage_packages(dev_package_info, dev_package_specs)
 
     # Exit now if we're not installing dependencies.
     if args.no_dependencies:
@@ -918,8 +1466,14 @@ def init(parser, args):
 
     # Continue with the rest of the initialization process.
     tty.msg('install dependencies')
-    dev.cmd.install_dependencies(dev_package_info=dev_package_info,
-                                 dep_specs=dep_specs)
+    with timer.phase('dependencies'):
+        dev.cmd.install_dependencies(dev_package_info=dev_package_info,
+                                     dep_specs=dep_specs,
+                                     unsigned=args.unsigned)
+
+    # Select the compiler cache (if any) for the wrappers.
+    if args.compiler_cache:
+        init_compiler_cache(args)
 
     # Create tool wrappers.
     global_wrappers_dir = create_cmd_links(specs)
@@ -928,18 +1482,54 @@ def init(parser, args):
     tty.msg('create environment files.')
     path_fixer = PathFixer(spack.store.root, spack_stage_top())
     path_fixer.set_packages(*dev_packages)
-    create_environment(dev_packages, dev_package_specs,
-                       path_fixer, global_wrappers_dir)
+    with timer.phase('environment'):
+        create_environment(dev_packages, dev_package_specs,
+                           path_fixer, global_wrappers_dir,
+                           args.compiler_wrappers)
+
+    # Share CMake's compiler detection between packages if desired.
+    initial_caches = {}
+    if args.seed_cmake:
+        tty.msg('seed CMake compiler detection')
+        with timer.phase('seed-cmake'):
+            initial_caches = seed_cmake_detection(dev_packages,
+                                                  global_wrappers_dir,
+                                                  build_system)
 
     # Generate the top level CMakeLists.txt.
     tty.msg('generate top level CMakeLists.txt')
-    write_cmakelists(dev_packages, dev_package_specs, build_system, path_fixer)
+    with timer.phase('cmakelists'):
+        write_cmakelists(dev_packages, dev_package_specs, build_system,
+                         path_fixer, args.test_step, initial_caches)
 
     # Initialize the build area.
     tty.msg('initialize build area')
-    init_build_area(build_system, args)
+    with timer.phase('build-area'):
+        init_build_area(build_system, args)
+        for dp, initial_cache in initial_caches.iteritems():
+            if initial_cache:
+                build_dir = os.path.join(spackdev_base, 'build', dp)
+                filesystem.mkdirp(build_dir)
+                apply_package_seed(spackdev_base, dp, build_dir)
+
+    # Configure packages if desired.
+    if args.configure is not None:
+        tty.msg('configure packages')
+        with timer.phase('configure'):
+            results = configure_packages(jobs=args.configure or None)
+        skipped = [result.package for result in results if result.skipped]
+        if skipped:
+            tty.msg('{0} of {1} packages not configured now because they '
+                    'depend on packages under development not yet '
+                    'installed: {2}'.format(len(skipped), len(results),
+                                            ' '.join(skipped)))
+        if not all(result.succeeded for result in results):
+            tty.warn('packages not configured now will be configured by the '
+                    'first build, or by spack dev configure once their '
+                    'dependencies are installed')
 
     # Done.
+    metrics.record(timer.samples('spackdev_init_phase_seconds'))
     tty.msg('initialization of {0} complete;'.format(spackdev_base))
     tty.msg('source {0} to begin.'.
             format(os.path.join(spackdev_base, dev.spackdev_aux_env_subdir,
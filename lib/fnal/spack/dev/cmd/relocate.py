@@ -0,0 +1,78 @@
+from __future__ import print_function
+
+import os
+import time
+
+from llnl.util import tty
+
+import fnal.spack.dev as dev
+from fnal.spack.dev.area import Area
+from fnal.spack.dev.environment import environment_from_pickle, unquote
+from fnal.spack.dev.locks import metadata_lock
+from fnal.spack.dev.relocation import relocate_tree
+from fnal.spack.dev.tree_roots import tree_path, trees
+
+description = "update a spackdev area for a new location after it has been moved"
+
+# Contain no area paths, or nothing that should be rewritten.
+_relocate_excludes = ('compiler-cache', 'locks', 'spec-store', 'spec-yaml')
+
+
+def setup_parser(subparser):
+    subparser.add_argument('--from', dest='old_base', metavar='OLD-BASE',
+                           help='previous location of the area (default as recorded in the area)')
+    subparser.add_argument('area', nargs='?', default='.',
+                           help='moved spackdev area (default current directory)')
+
+
+def relocate_area(area, old_base, old_trees=None):
+    """Rewrite old_base as the location of area throughout its generated
+    files, returning the lists of files changed and of binary files that
+    could not be rewritten. old_trees optionally maps trees placed
+    outside the area (cf tree_roots) to their previous locations, to be
+    rewritten as their current ones first."""
+    moves = [(old_trees[tree], tree_path(area.base, tree)) for tree in
+             trees if tree in (old_trees or {})] + [(old_base, area.base)]
+    changed = []
+    not_relocated = []
+    # Trees placed elsewhere are relocated where they are.
+    for top in [area.path(dev.spackdev_aux_subdir),
+                os.path.join(area.srcs_dir, 'CMakeLists.txt')] + \
+            [tree_path(area.base, tree) for tree in trees]:
+        if not os.path.lexists(top):
+            continue
+        tty.debug('relocating files under {0}'.format(top))
+        for old, new in moves:
+            (top_changed, top_not_relocated)\
+                = relocate_tree(top, old, new, exclude=_relocate_excludes)
+            changed += [path for path in top_changed if path not in changed]
+            not_relocated += [path for path in top_not_relocated if
+                              path not in not_relocated]
+    return changed, not_relocated
+
+
+def relocate(parser, args):
+    start = time.time()
+    base = os.path.abspath(os.path.expanduser(args.area))
+    env_file = os.path.join(base, dev.spackdev_aux_env_subdir, 'env.pickle')
+    if not os.path.exists(env_file):
+        tty.die('spack dev relocate: {0} is not an initialized SpackDev area'.
+                format(base))
+    old_base = args.old_base or \
+        unquote(environment_from_pickle(env_file)['SPACKDEV_BASE'])
+    old_base = os.path.normpath(old_base)
+    if old_base == base:
+        tty.msg('{0} is already configured for its current location'.
+                format(base))
+        return
+    tty.msg('relocating {0} from {1}'.format(base, old_base))
+    with metadata_lock(base).write():
+        (changed, not_relocated) = relocate_area(Area(base), old_base)
+    tty.msg('updated {0} files ({1:.1f} s)'.
+            format(len(changed), time.time() - start))
+    if not_relocated:
+        tty.warn('unable to relocate {0} binary files (e.g. {1}): they will refer to {2} until they are rebuilt'.
+                 format(len(not_relocated), not_relocated[0], old_base))
+        tty.debug('not relocated:\n  {0}'.format('\n  '.join(not_relocated)))
+    tty.msg('source {0} to continue.'.
+            format(os.path.join(base, dev.spackdev_aux_env_subdir, 'env.sh')))
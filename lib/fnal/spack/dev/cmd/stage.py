@@ -2,11 +2,18 @@ import argparse
 from llnl.util import tty
 
 import fnal.spack.dev as dev
+from fnal.spack.dev.area import current_area
 
 description  = 'stage packages in a spackdev area'
 
 
 def setup_parser(subparser):
+    subparser.add_argument('--clone-depth', dest='clone_depth', type=int,
+                           metavar='DEPTH',
+                           help='clone only the last DEPTH commits of the requested branch or tag of git packages (default: as specified to spack dev init)')
+    subparser.add_argument('--clone-filter', dest='clone_filter',
+                           metavar='FILTER',
+                           help='make partial clones of git packages with this object filter, e.g. blob:none (default: as specified to spack dev init)')
     subparser.add_argument('packages', nargs='*',
                            help="specs of packages to stage; if empty stage all packages")
 
@@ -19,10 +26,10 @@ def validate_args(packages, all_packages):
 
 
 def stage(parser, args):
-    requested, additional, deps, install_specs = dev.cmd.read_package_info()
+    requested, additional, deps = dev.cmd.read_package_info(want_specs=False)
     all_package_names = [p.name for p in requested + additional]
 
-    validate_args(args.packages, all_packages_names)
+    validate_args(args.packages, all_package_names)
     if len(args.packages) == 0:
         packages = requested + additional
     else:
@@ -32,4 +39,5 @@ def stage(parser, args):
     for package in packages:
         tty.msg('staging ' + package.name)
         dev.cmd.stage_package(package,
-                              dev.cmd.get_package_spec(package.name, install_specs))
+                              current_area().spec_for(package.name),
+                              args.clone_depth, args.clone_filter)
@@ -0,0 +1,196 @@
+from __future__ import print_function
+
+import glob
+import multiprocessing
+import os
+import re
+import subprocess
+import sys
+import threading
+import xml.etree.ElementTree as ET
+
+from llnl.util import tty
+
+import fnal.spack.dev as dev
+from fnal.spack.dev.area import current_area
+from fnal.spack.dev.cmd import write_file_atomically
+from fnal.spack.dev.cmd.foreach import selected_packages, report_result, \
+    summarize_results
+from fnal.spack.dev.metrics import record_results
+from fnal.spack.dev.runner import Package_result, run_in_package, \
+    run_for_packages
+from fnal.spack.dev.tree_roots import check_trees
+
+description = "run the tests of each (or selected) spackdev package concurrently and collect the results"
+
+junit_filename = 'spackdev-junit.xml'
+
+
+def setup_parser(subparser):
+    subparser.add_argument('-j', '--jobs', type=int,
+                           default=multiprocessing.cpu_count(),
+                           help='total number of cores to be shared among all ctest invocations (default {0})'.format(multiprocessing.cpu_count()))
+    subparser.add_argument('-P', '--parallel-packages', type=int,
+                           dest='parallel_packages',
+                           help='maximum number of packages to test concurrently (default: as many as the core budget allows)')
+    subparser.add_argument('--rerun-failed', action='store_true',
+                           default=False,
+                           help='re-run only the tests that failed during the previous invocation, skipping packages with no failed tests')
+    subparser.add_argument('-o', '--output', dest='output',
+                           help='file to which to write the combined JUnit XML report (default build/spackdev-test-results.xml)')
+    subparser.add_argument('-a', '--ctest-arg', action='append',
+                           dest='ctest_args', default=[], metavar='ARG',
+                           help='additional argument to pass to ctest (may be repeated)')
+    subparser.add_argument('-v', '--verbose', action='store_true',
+                           default=False,
+                           help='show ctest output for successful packages also')
+    subparser.add_argument('packages', nargs='*', metavar='PACKAGE',
+                           help='packages to test (default is all packages)')
+
+
+def ctest_command(area):
+    ctest = area.path(dev.spackdev_aux_bin_subdir, 'ctest')
+    return ctest if os.path.exists(ctest) else 'ctest'
+
+
+def ctest_supports_junit(ctest):
+    """Does ctest support --output-junit (CMake 3.21 or later)?"""
+    try:
+        output = subprocess.check_output([ctest, '--version'],
+                                         stderr=subprocess.STDOUT)
+    except (OSError, subprocess.CalledProcessError):
+        return False
+    match = re.search(r'(\d+)\.(\d+)', output)
+    return bool(match) and \
+        (int(match.group(1)), int(match.group(2))) >= (3, 21)
+
+
+def have_failed_tests(build_dir):
+    for log in glob.glob(os.path.join(build_dir, 'Testing', 'Temporary',
+                                      'LastTestsFailed*.log')):
+        if os.path.getsize(log) > 0:
+            return True
+    return False
+
+
+def divide_cores(jobs, parallel_packages, npackages):
+    """Return the number of packages to test concurrently and the ctest
+    parallelism to use for each, given a total core budget."""
+    jobs = max(jobs, 1)
+    concurrent = min(parallel_packages or jobs, jobs, max(npackages, 1))
+    return concurrent, max(jobs // concurrent, 1)
+
+
+def package_testsuite(result, junit_file):
+    """Return the testsuite element for a package, from the JUnit output
+    of ctest if available or else synthesized from the overall result."""
+    try:
+        testsuite = ET.parse(junit_file).getroot()
+        if testsuite.tag == 'testsuites':
+            testsuite = testsuite.find('testsuite')
+        if testsuite is not None:
+            testsuite.set('name', result.package)
+            return testsuite
+    except (IOError, ET.ParseError):
+        pass
+    # No (usable) JUnit output, e.g. from ctest < 3.21.
+    testsuite = ET.Element('testsuite',
+                           name=result.package,
+                           tests='1',
+                           failures='1' if result.returncode else '0',
+                           skipped='1' if result.skipped else '0',
+                           time='{0:.3f}'.format(result.seconds))
+    testcase = ET.SubElement(testsuite, 'testcase', name='ctest',
+                             classname=result.package,
+                             time='{0:.3f}'.format(result.seconds))
+    if result.skipped:
+        ET.SubElement(testcase, 'skipped', message=result.output.strip())
+    elif not result.succeeded:
+        failure = ET.SubElement(testcase, 'failure',
+                                message='ctest exit status {0}'.
+                                format(result.returncode))
+        failure.text = result.output
+    return testsuite
+
+
+def write_report(filename, results, junit_files):
+    testsuites = ET.Element('testsuites')
+    totals = {'tests': 0, 'failures': 0, 'errors': 0, 'skipped': 0}
+    seconds = 0.0
+    for result in results:
+        testsuite = package_testsuite(result, junit_files[result.package])
+        for attr in totals:
+            try:
+                totals[attr] += int(testsuite.get(attr, 0))
+            except ValueError:
+                pass
+        try:
+            seconds += float(testsuite.get('time', 0))
+        except ValueError:
+            pass
+        testsuites.append(testsuite)
+    for attr, value in totals.items():
+        testsuites.set(attr, str(value))
+    testsuites.set('time', '{0:.3f}'.format(seconds))
+    write_file_atomically(filename,
+                          '<?xml version="1.0" encoding="UTF-8"?>\n' +
+                          ET.tostring(testsuites))
+    return totals
+
+
+def test(parser, args):
+    area = current_area()
+    check_trees(area)
+    packages = selected_packages(area, args.packages)
+    ctest = ctest_command(area)
+    junit_files = dict((package,
+                        os.path.join(area.build_dir, package, 'Testing',
+                                     junit_filename))
+                       for package in packages)
+
+    if args.rerun_failed:
+        packages = [package for package in packages if
+                    have_failed_tests(os.path.join(area.build_dir, package))]
+        if not packages:
+            tty.msg('no previously-failed tests to re-run')
+            return
+
+    (concurrent, ctest_jobs)\
+        = divide_cores(args.jobs, args.parallel_packages, len(packages))
+    tty.msg('testing {0} packages, {1} at a time with ctest -j {2}'.
+            format(len(packages), concurrent, ctest_jobs))
+    cmd = [ctest, '-j', str(ctest_jobs), '--output-on-failure']
+    if ctest_supports_junit(ctest):
+        cmd.extend(['--output-junit', os.path.join('Testing', junit_filename)])
+    else:
+        tty.msg('ctest is older than 3.21: reporting one test case per package')
+    if args.rerun_failed:
+        cmd.append('--rerun-failed')
+    cmd.extend(args.ctest_args)
+
+    output_lock = threading.Lock()
+
+    def task(package):
+        # Remove stale results so they are not reported for this run.
+        if os.path.exists(junit_files[package]):
+            os.remove(junit_files[package])
+        return run_in_package(package, cmd,
+                              os.path.join(area.build_dir, package))
+
+    def callback(result):
+        with output_lock:
+            if result.succeeded and not args.verbose:
+                result = Package_result(result.package, result.returncode,
+                                        '', result.seconds)
+            report_result(result)
+
+    results = run_for_packages(packages, task, concurrent, callback=callback)
+    record_results(area, 'test', results)
+
+    output = args.output or os.path.join(area.build_dir,
+                                         'spackdev-test-results.xml')
+    totals = write_report(output, results, junit_files)
+    tty.msg('{0} tests, {1} failures, {2} errors, {3} skipped: report written to {4}'.
+            format(totals['tests'], totals['failures'], totals['errors'],
+                   totals['skipped'], output))
+    sys.exit(summarize_results(results))
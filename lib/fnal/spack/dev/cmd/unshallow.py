@@ -0,0 +1,57 @@
+import os
+import sys
+import time
+
+from llnl.util import tty
+
+from fnal.spack.dev.area import current_area
+from fnal.spack.dev.cmd.foreach import selected_packages
+from fnal.spack.dev.locks import stage_lock
+from fnal.spack.dev.metrics import tree_size
+from fnal.spack.dev.partial_clone import Clone_error, is_shallow, \
+    partial_clone_filter, unshallow as unshallow_clone
+
+description = "fetch more history for spackdev packages staged with a limited clone depth"
+
+
+def setup_parser(subparser):
+    subparser.add_argument('--deepen', type=int, metavar='N',
+                           help='fetch only N more commits of the current branch (default: the full history of all branches and tags)')
+    subparser.add_argument('packages', nargs='*', metavar='PACKAGE',
+                           help='packages to unshallow (default is all shallow packages)')
+
+
+def unshallow(parser, args):
+    area = current_area()
+    status = 0
+    for package in selected_packages(area, args.packages):
+        src = os.path.join(area.srcs_dir, package)
+        if not os.path.exists(os.path.join(src, '.git')):
+            if args.packages:
+                tty.warn('{0} is not a git clone'.format(package))
+            continue
+        with stage_lock(area.base, package).write():
+            try:
+                if not is_shallow(src):
+                    if args.packages:
+                        filter_spec = partial_clone_filter(src)
+                        tty.msg('{0} already has full history{1}'.
+                                format(package,
+                                       ' (partial clone with filter {0}: '
+                                       'missing objects are fetched on '
+                                       'demand)'.format(filter_spec)
+                                       if filter_spec else ''))
+                    continue
+                start = time.time()
+                unshallow_clone(src, args.deepen)
+            except Clone_error as e:
+                tty.error('unable to unshallow {0}: {1}'.format(package, e))
+                status = 1
+                continue
+        tty.msg('{0}: fetched {1} in {2:.1f} s: now {3:.1f} MiB'.
+                format(package,
+                       '{0} more commits'.format(args.deepen)
+                       if args.deepen else 'full history',
+                       time.time() - start, tree_size(src) / 1048576.0))
+    if status:
+        sys.exit(status)
@@ -0,0 +1,64 @@
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+from llnl.util import tty
+
+from fnal.spack.dev.area import current_area
+from fnal.spack.dev.cmd.build import affected_packages, build_packages
+from fnal.spack.dev.cmd.foreach import selected_packages
+from fnal.spack.dev.tree_roots import check_trees
+from fnal.spack.dev.watcher import make_watcher, wait_for_changes
+
+description = "watch the sources of spackdev packages and rebuild those affected by each change"
+
+
+def setup_parser(subparser):
+    subparser.add_argument('-d', '--delay', type=float, default=0.5,
+                           help='seconds without further changes before building (default 0.5)')
+    subparser.add_argument('-j', '--jobs', type=int,
+                           help='number of packages to build concurrently (default number of cores)')
+    subparser.add_argument('-t', '--target', default='install',
+                           help='build target for each affected package (default install)')
+    subparser.add_argument('--no-dependents', action='store_true',
+                           default=False,
+                           help='do not rebuild packages that depend on changed packages')
+    subparser.add_argument('--poll', action='store_true', default=False,
+                           help='poll for changes rather than using inotify')
+    subparser.add_argument('packages', nargs='*', metavar='PACKAGE',
+                           help='packages to watch (default is all packages)')
+
+
+def watch(parser, args):
+    area = current_area()
+    check_trees(area)
+    packages = selected_packages(area, args.packages)
+    dependencies = area.dev_package_dependencies()
+    watcher = make_watcher(dict((package, os.path.join(area.srcs_dir,
+                                                       package))
+                                for package in packages if
+                                os.path.isdir(os.path.join(area.srcs_dir,
+                                                           package))),
+                           args.poll)
+    tty.msg('watching {0} packages for changes (interrupt to stop)'.
+            format(len(watcher.sources)))
+    try:
+        while True:
+            changed = wait_for_changes(watcher, args.delay)
+            start = time.time()
+            affected = affected_packages(area.dev_packages(), changed,
+                                         dependencies, not args.no_dependents)
+            tty.msg('changed: {0}; building {1}'.
+                    format(' '.join(sorted(changed)), ' '.join(affected)))
+            results = build_packages(area, affected, args.target, args.jobs)
+            failed = [result.package for result in results if
+                      not result.succeeded]
+            tty.msg('{0} ({1:.1f} s); watching for changes'.
+                    format('failed: {0}'.format(' '.join(failed)) if failed
+                           else 'up to date', time.time() - start))
+    except KeyboardInterrupt:
+        sys.stdout.write('\n')
+    finally:
+        watcher.close()
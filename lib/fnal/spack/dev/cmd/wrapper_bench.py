@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+from __future__ import print_function
+
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from llnl.util import tty
+
+import fnal.spack.dev as dev
+from fnal.spack.dev.area import current_area
+from fnal.spack.dev.environment import load_environment, unquote
+
+description = "measure the per-invocation overhead of the compiler wrappers of a spackdev package"
+
+# Minimal translation unit for each compiler variable.
+_bench_sources = {'CC': ('c', 'int main() { return 0; }\n'),
+                  'CXX': ('cc', 'int main() { return 0; }\n'),
+                  'F77': ('f', '      program bench\n      end\n'),
+                  'FC': ('f90', 'program bench\nend program bench\n')}
+
+
+def setup_parser(subparser):
+    subparser.add_argument('-n', '--iterations', type=int, default=20,
+                           help='number of invocations to time for each compiler and wrapper (default 20)')
+    subparser.add_argument('--link', action='store_true', default=False,
+                           help='time compile-and-link invocations instead of compile-only')
+    subparser.add_argument('package',
+                           help='package whose compiler wrappers should be measured')
+
+
+def time_invocation(cmd, environment, iterations, cwd):
+    """Return the mean wall-clock time in seconds of iterations
+    invocations of cmd, or None if any of them fails (or cmd cannot be
+    executed, e.g. because the compiler has moved)."""
+    with open(os.devnull, 'w') as devnull:
+        start = time.time()
+        for i in range(iterations):
+            try:
+                if subprocess.call(cmd, env=environment, cwd=cwd,
+                                   stdout=devnull, stderr=devnull):
+                    return None
+            except OSError:
+                return None
+        return (time.time() - start) / iterations
+
+
+def wrapper_bench(parser, args):
+    area = current_area()
+    environment = load_environment(args.package)
+    # Select the package's configuration when invoking the shared
+    # wrappers directly.
+    environment['SPACKDEV_PACKAGE'] = args.package
+    wrappers_dir = area.path(dev.spackdev_aux_wrappers_subdir)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        for var in ('CC', 'CXX', 'F77', 'FC'):
+            if var not in environment or \
+               'SPACK_{0}'.format(var) not in environment:
+                continue
+            name = os.path.basename(unquote(environment[var]))
+            ext, text = _bench_sources[var]
+            source = os.path.join(tmpdir, 'bench.{0}'.format(ext))
+            with open(source, 'w') as f:
+                f.write(text)
+            cmd_args = [source, '-o',
+                        os.path.join(tmpdir, 'bench' if args.link else
+                                     'bench.o')]
+            if not args.link:
+                cmd_args.insert(0, '-c')
+            timings = []
+            for label, cmd in \
+                (('compiler', unquote(environment['SPACK_{0}'.format(var)])),
+                 ('spack wrapper', os.path.join(wrappers_dir, 'spack', name)),
+                 ('fast wrapper', os.path.join(wrappers_dir, 'fast', name))):
+                if not os.path.exists(cmd) and label != 'compiler':
+                    continue
+                timings.append((label, time_invocation([cmd] + cmd_args,
+                                                       environment,
+                                                       args.iterations,
+                                                       tmpdir)))
+            baseline = timings[0][1]
+            tty.msg('{0} ({1}), mean of {2} {3} invocations:'.
+                    format(var, name, args.iterations,
+                           'compile-and-link' if args.link else 'compile'))
+            for label, mean in timings:
+                if mean is None:
+                    print('    {0:<14} failed'.format(label))
+                elif baseline is None or label == 'compiler':
+                    print('    {0:<14} {1:8.2f} ms'.format(label, mean * 1000))
+                else:
+                    print('    {0:<14} {1:8.2f} ms (overhead {2:+.2f} ms)'.
+                          format(label, mean * 1000,
+                                 (mean - baseline) * 1000))
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
@@ -1,5 +1,6 @@
 import os
 import re
+import shlex
 
 from llnl.util import tty
 from six.moves import shlex_quote as cmd_quote
@@ -20,6 +21,13 @@ def environment_from_string(env_string):
     return environment
 
 
+def unquote(value):
+    if value and value[0] == "'" and value[-1] == "'":
+        # It's been quoted: we need to unquote it.
+        value = shlex.split(value)[0]
+    return value
+
+
 def environment_from_pickle(path):
     environment = cPickle.load(open(path, 'rb'))
     assert(type(environment) == dict)
@@ -34,16 +42,9 @@ _var_whitelist = re.compile(r'SPACK(?:DEV)?_')
 
 
 def load_environment(package):
-    package_env_file_name\
-        = os.path.join(os.environ['SPACKDEV_BASE'],
-                       dev.spackdev_aux_packages_subdir,
-                       package,
-                       'env',
-                       'env.pickle')
-    if not os.path.exists(package_env_file_name):
-        tty.die('unable to find environment for {0}: not a package being developed?'.format(package))
+    from fnal.spack.dev.area import current_area
     environment = os.environ.copy()
-    environment.update(environment_from_pickle(package_env_file_name))
+    environment.update(current_area().package_environment(package))
     return environment
 
 
@@ -57,18 +58,18 @@ def sanitized_environment(environment, drop_unchanged=False):
 
 def bootstrap_environment(pathname=''):
     if pathname or 'SPACKDEV_BASE' not in os.environ:
-        env_file_name = os.path.join(pathname, dev.spackdev_aux_subdir, 'env.pickle')
+        env_file_name = os.path.join(pathname, dev.spackdev_aux_env_subdir,
+                                     'env.pickle')
         if os.path.exists(env_file_name):
             os.environ.update(sanitized_environment
                               (environment_from_pickle(env_file_name)))
         else:
             tty.die('unable to find spackdev area{pname}: please source {env_sh} or execute from parent of {aux_subdir}'.
                     format(pname=' ({0})'.format(pathname) if pathname else '',
-                           env_sh=os.path.join(dev.spackdev_aux_subdir, 'env.sh'),
+                           env_sh=os.path.join(dev.spackdev_aux_env_subdir, 'env.sh'),
                            aux_subdir=dev.spackdev_aux_subdir))
 
 
 def srcs_topdir():
-    bootstrap_environment()
-    result = os.path.join(os.environ['SPACKDEV_BASE'], 'srcs')
-    return result
+    from fnal.spack.dev.area import current_area
+    return current_area().srcs_dir
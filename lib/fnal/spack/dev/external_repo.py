@@ -6,6 +6,12 @@ import os
 import os.path
 import sys
 import imp
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+
+from fnal.spack.dev.external_package import External_package
+import fnal.spack.dev.external_tools as external_tools
+from fnal.spack.dev.prefix_index import Prefix_index
 
 
 def parent_dir(path, n):
@@ -19,9 +25,28 @@ def mod_to_class(name):
     return name.replace('-', '_').capitalize()
 
 
+def run_probe(probe):
+    """Run the find() method of an external's probe class (restricted to
+    an installation prefix if one is specified), returning the name of
+    the external and the External_package found."""
+    name, class_ = probe[:2]
+    try:
+        if len(probe) > 2:
+            return name, external_tools.probe_in_prefix(class_, probe[2])
+        return name, class_().find()
+    except Exception as e:
+        sys.stderr.write('findext {0}: probe failed: {1}\n'.format(name, e))
+        return name, External_package(name, None, None)
+
+
 class External_repo:
-    def __init__(self):
-        spackdev_root = parent_dir(__file__, 4)
+    def __init__(self, jobs=None, probe_cache=None, scan_roots=None,
+                 scan_depth=4):
+        self.jobs = jobs or cpu_count()
+        self.probe_cache = probe_cache
+        self.scan_roots = scan_roots or []
+        self.scan_depth = scan_depth
+        spackdev_root = parent_dir(__file__, 5)
         self.externals_path = os.path.join(spackdev_root, 'var', 'spackdev',
                                            'repo', 'packages')
         self.external_file_name = 'external.py'
@@ -40,16 +65,84 @@ class External_repo:
 
     def _find_external_packages(self):
         self._all_external_packages = {}
+        self._all_found_external_packages = {}
+        # Load probe modules serially; the probes themselves are
+        # independent of each other and of the current directory, and
+        # are dominated by waiting on compilers and executables.
+        probes = [(name, self.get_pkg_class(name)) for
+                  name in self._all_external_names]
+        external_tools.probe_cache = self.probe_cache
+        pool = ThreadPool(self.jobs)
+        try:
+            # Batch library probes by prefix, ahead of running the probes
+            # themselves. Probe classes are adapted by recording the
+            # arguments with which they would call the probe functions.
+            recorded = [external_tools.record_probe(class_) for
+                        name, class_ in probes]
+            library_probes = [probe for kind, probe in
+                              filter(None, recorded) if kind == 'library']
+            if self.scan_roots:
+                (scan_probes, scan_library_probes)\
+                    = self._scan_probes(probes, recorded, pool)
+                probes.extend(scan_probes)
+                library_probes.extend(scan_library_probes)
+            external_tools.batch_library_probes(library_probes, pool)
+            results = pool.map(run_probe, probes)
+        finally:
+            pool.close()
+            pool.join()
+            external_tools.probe_cache = None
+            external_tools.batch_results.clear()
+        if self.probe_cache:
+            self.probe_cache.write()
+        # Results of unrestricted probes come first.
+        for name, external_package in results:
+            found = self._all_found_external_packages.setdefault(name, [])
+            if external_package.pathname:
+                if external_package.pathname in \
+                   [p.pathname for p in found]:
+                    continue
+                found.append(external_package)
+                self._all_external_packages.setdefault(name,
+                                                       external_package)
         for name in self._all_external_names:
             print('findext ' + name + ': ', end='')
-            external_package = self.get_pkg_class(name)().find()
-            if external_package.pathname:
-                self._all_external_packages[name] = external_package
-                print(
-                    external_package.version + ' in ' + external_package.pathname)
+            found = self._all_found_external_packages.get(name)
+            if found:
+                print('\n    '.join(
+                    [(external_package.version + ' in '
+                      if external_package.version else '') +
+                     external_package.pathname
+                     for external_package in found]))
             else:
                 print('not found')
 
+    def _scan_probes(self, probes, recorded, pool):
+        '''Index the scan roots and return additional probes restricted to
+        the prefixes relevant to each external, and the corresponding
+        library probe descriptions for batching.'''
+        print('findext: scanning {0}'.format(' '.join(self.scan_roots)))
+        index = Prefix_index(self.scan_roots, pool, self.scan_depth)
+        print('findext: found {0} installation prefixes'.
+              format(len(index.prefixes)))
+        scan_probes = []
+        scan_library_probes = []
+        for (name, class_), record in zip(probes, recorded):
+            if not record:
+                continue
+            kind, probe = record
+            if kind == 'library':
+                prefixes\
+                    = index.prefixes_for_headers(probe['headers_list'])
+                scan_library_probes.extend([dict(probe, prefixes=[prefix])
+                                            for prefix in prefixes])
+            else:
+                prefixes\
+                    = index.prefixes_for_executable(probe['executable'])
+            scan_probes.extend([(name, class_, prefix) for
+                                prefix in prefixes])
+        return scan_probes, scan_library_probes
+
     def all_external_names(self):
         '''Returns a sorted list of all externals in external repo'''
         return self._all_external_names
@@ -58,6 +151,12 @@ class External_repo:
         '''Returns a dict containing External_package objects'''
         return self._all_external_packages
 
+    def all_found_external_packages(self):
+        '''Returns a dict containing lists of all External_package objects
+        found for each external'''
+        return dict((name, found) for name, found in
+                    self._all_found_external_packages.items() if found)
+
     def get_pkg_class(self, pkg_name):
         '''Get the class for a package out of its module'''
 
@@ -68,7 +167,7 @@ class External_repo:
             sys.stderr.write(
                 'External_repo.get_pkg_class: could not find "{0}"\n'.format(
                     path_name))
-        module_name = 'spackdev.external_repo.{0}'.format(pkg_name)
+        module_name = 'spackdev_external_repo_{0}'.format(pkg_name.replace('-', '_'))
         module = imp.load_source(module_name, path_name)
         module.__package__ = 'spackdev.external_repo'
         class_name = mod_to_class(pkg_name)
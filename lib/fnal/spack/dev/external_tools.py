@@ -1,12 +1,16 @@
 #!/usr/bin/env python
 
-import commands
+import json
 import os
 import re
+import shutil
+import subprocess
 import sys
 import tempfile
+import threading
 
 from external_package import External_package
+from fnal.spack.dev.cmd import write_file_atomically
 
 if sys.version_info[0] > 3 or \
    (sys.version_info[0] == 3 and sys.version_info[1] > 2):
@@ -21,13 +25,119 @@ def status_write(output):
         sys.stderr.write(output)
 
 
+def getstatusoutput(command, cwd=None):
+    """Run command in the shell (in directory cwd if specified) and
+    return its exit status and combined output, cf
+    commands.getstatusoutput(). Unlike the latter, safe to call
+    concurrently for different working directories.
+    """
+    process = subprocess.Popen(command, shell=True, cwd=cwd,
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT,
+                               close_fds=True)
+    output = process.communicate()[0]
+    if output[-1:] == '\n':
+        output = output[:-1]
+    return (process.returncode, output)
+
+
+class Probe_cache:
+    """Persistent cache of probe results.
+
+    Each entry is stored under a key describing the probe, together
+    with a stamp describing the state of the files the probe depends on
+    (pathnames, modification times and sizes): an entry is only used if
+    its stamp matches the current state of those files.
+    """
+    def __init__(self, filename, refresh=False):
+        self.filename = filename
+        self.refresh = refresh
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._dirty = False
+        if os.path.exists(filename):
+            try:
+                with open(filename, 'r') as f:
+                    self._entries = json.load(f)
+            except ValueError:
+                sys.stderr.write('Probe_cache: ignoring corrupt cache file {0}\n'.
+                                 format(filename))
+
+    def lookup(self, key, stamp):
+        """Return the cached result for key as a one-element list, or None
+        if there is no valid entry."""
+        if self.refresh:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry and entry['stamp'] == json.loads(json.dumps(stamp)):
+            return [entry['result']]
+        return None
+
+    def store(self, key, stamp, result):
+        with self._lock:
+            self._entries[key] = {'stamp': stamp, 'result': result}
+            self._dirty = True
+
+    def write(self):
+        if not self._dirty:
+            return
+        write_file_atomically(self.filename,
+                              json.dumps(self._entries, indent=1,
+                                         sort_keys=True))
+        self._dirty = False
+
+
+# Set to a Probe_cache object to enable caching of probe results.
+probe_cache = None
+
+
+def file_stamp(pathname):
+    """Identify the current state of pathname for cache validation."""
+    try:
+        stat = os.stat(pathname)
+        return [os.path.realpath(pathname), stat.st_mtime, stat.st_size]
+    except OSError:
+        return [pathname, None, None]
+
+
+def cached_probe(key, stamp, probe):
+    """Return the result of probe(), or a cached result for the same key
+    and stamp if available."""
+    if probe_cache is None:
+        return probe()
+    key = json.dumps(key)
+    cached = probe_cache.lookup(key, stamp)
+    if cached:
+        return cached[0]
+    result = probe()
+    probe_cache.store(key, stamp, result)
+    return result
+
+
 def find_executable_version(executable, version_arg='--version',
                             version_regexp='[0-9]+\.[0-9\.]+[0-9a-z-]*'):
-    pathname = which(executable)
+    if getattr(_recording, 'active', False):
+        raise Probe_recorded('executable',
+                             {'executable': executable,
+                              'version_arg': version_arg,
+                              'version_regexp': version_regexp})
+    prefix = getattr(_restriction, 'prefix', None)
+    if prefix:
+        pathname = os.path.join(prefix, 'bin', executable)
+        if not os.access(pathname, os.X_OK):
+            pathname = None
+    else:
+        pathname = which(executable)
     if pathname:
         prefix = os.path.dirname(os.path.dirname(pathname))
-        version = extract_executable_version(pathname, version_arg,
-                                             version_regexp)
+        # Keyed by pathname: probes restricted to different prefixes
+        # find different executables.
+        version = cached_probe(['executable', pathname, version_arg,
+                                version_regexp],
+                               file_stamp(pathname),
+                               lambda: extract_executable_version
+                               (pathname, version_arg, version_regexp))
     else:
         prefix = None
         version = None
@@ -37,7 +147,7 @@ def find_executable_version(executable, version_arg='--version',
 def extract_executable_version(pathname, arg='--version', 
         regexp='[0-9]+\.[0-9\.]+[0-9a-z-]*'):
     command = "{0} {1}".format(pathname, arg)
-    (status, output) = commands.getstatusoutput(command)
+    (status, output) = getstatusoutput(command)
     match = re.search(regexp, output)
     if match:
         retval = match.group(0)
@@ -56,8 +166,8 @@ def status_write(message, verbose):
 
 
 def compile_test_program(lines, compiler, include_flags, link_flags,
-                         verbose=False):
-    f = open('tmp.cc', 'w')
+                         verbose=False, workdir=None):
+    f = open(os.path.join(workdir or os.curdir, 'tmp.cc'), 'w')
     status_write(
         "debug_config: test compiling C++ program:\n"
         + "----------------begin----------------"
@@ -74,7 +184,7 @@ def compile_test_program(lines, compiler, include_flags, link_flags,
     status_write(
         "debug_config: " + command
         + "\n", verbose)
-    (error_status, output) = commands.getstatusoutput(command)
+    (error_status, output) = getstatusoutput(command, cwd=workdir)
     status_write(
         "debug_config: compilation completed with status " + str(error_status)
         + " and output:\n"
@@ -96,6 +206,292 @@ def find_library_version(library, headers,
                          compiler='c++',
                          prefixes=['/usr', '/usr/local'],
                          verbose=False):
+    if getattr(_restriction, 'prefix', None):
+        prefixes = [_restriction.prefix]
+    probe = {'library': library, 'headers_list': listify(headers),
+             'define': define, 'regexp': regexp,
+             'include_flags': include_flags, 'link_flags': link_flags,
+             'compiler': compiler, 'prefixes': list(prefixes),
+             'verbose': verbose}
+    if getattr(_recording, 'active', False):
+        raise Probe_recorded('library', probe)
+    key = library_probe_key(probe)
+    (version, good_prefix)\
+        = cached_probe(key, library_probe_stamp(probe),
+                       lambda: batch_results.get(json.dumps(key)) or
+                       library_probe(probe['headers_list'], define, regexp,
+                                     include_flags, link_flags,
+                                     compiler, prefixes, verbose))
+    return External_package(library, version, good_prefix)
+
+
+def library_probe_key(probe):
+    # Results depend on how versions are extracted (cf findext
+    # --compile-probes).
+    return ['library', 'preprocess' if preprocess_probes else 'compile'] + \
+        [probe[item] for item in
+         ('library', 'headers_list', 'define', 'regexp', 'include_flags',
+          'link_flags', 'compiler', 'prefixes')]
+
+
+def library_probe_stamp(probe):
+    return [file_stamp(os.path.join(prefix, 'include', header))
+            for prefix in probe['prefixes']
+            for header in probe['headers_list']]
+
+
+class Probe_recorded(Exception):
+    """Raised by the probe functions in recording mode to return the
+    description of the probe requested to record_probe()."""
+    def __init__(self, kind, probe):
+        Exception.__init__(self, kind)
+        self.kind = kind
+        self.probe = probe
+
+
+_recording = threading.local()
+
+
+def record_probe(probe_class):
+    """Adapter for existing probe classes: run probe_class().find() with
+    the probe functions recording their arguments rather than probing.
+    Returns (kind, probe) for the first probe function called, or None.
+    """
+    _recording.active = True
+    try:
+        probe_class().find()
+    except Probe_recorded as e:
+        return (e.kind, e.probe)
+    except Exception:
+        pass
+    finally:
+        _recording.active = False
+    return None
+
+
+_restriction = threading.local()
+
+
+def probe_in_prefix(probe_class, prefix):
+    """Run probe_class().find() with the probe functions looking only in
+    the given installation prefix."""
+    _restriction.prefix = prefix
+    try:
+        return probe_class().find()
+    finally:
+        _restriction.prefix = None
+
+
+# Results of batched library probes, by probe key: consulted by
+# find_library_version() before probing individually.
+batch_results = {}
+
+
+def batch_library_probes(probes, pool, verbose=False):
+    """Probe for all the given libraries (described as recorded by
+    record_probe()) with a single test program per prefix covering all
+    libraries sharing the same compiler and flags, and store the results
+    in batch_results. Libraries whose result could not be established
+    this way are left to be probed individually."""
+    groups = {}
+    for probe in probes:
+        if not probe['define']:
+            continue
+        key = json.dumps(library_probe_key(probe))
+        if probe_cache and probe_cache.lookup(key, library_probe_stamp(probe)):
+            continue
+        groups.setdefault((probe['compiler'], probe['include_flags'],
+                           probe['link_flags']), []).append((key, probe))
+    for (compiler, include_flags, link_flags), members in groups.items():
+        prefixes = []
+        for key, probe in members:
+            prefixes.extend([prefix for prefix in probe['prefixes'] if
+                             prefix not in prefixes])
+        tasks = [(prefix,
+                  [(i, probe) for i, (key, probe) in enumerate(members) if
+                   prefix in probe['prefixes']],
+                  compiler, include_flags, link_flags, verbose)
+                 for prefix in prefixes]
+        values_by_prefix = dict(zip(prefixes,
+                                    pool.map(batch_probe_prefix, tasks)))
+        for i, (key, probe) in enumerate(members):
+            result = [None, None]
+            for prefix in probe['prefixes']:
+                values = values_by_prefix[prefix]
+                if values is None or (i in values and values[i] is None):
+                    # Inconclusive: probe individually.
+                    result = None
+                    break
+                elif i in values:
+                    result = [extract_version(values[i], probe['regexp']),
+                              prefix]
+                    break
+            if result:
+                batch_results[key] = result
+
+
+_batch_value = re.compile(r'^spackdev_version ([0-9]+) (.*?)(?=^spackdev_version |^spackdev_end)',
+                          re.MULTILINE | re.DOTALL)
+
+
+def batch_probe_prefix(task):
+    """Build and run (or preprocess) one test program reporting the values
+    of the defines of all the given libraries found under prefix.
+    Returns a dictionary of found values (None if not usable) by library
+    index, or None if the test program failed."""
+    (prefix, members, compiler, include_flags, link_flags, verbose) = task
+    lines = []
+    if not preprocess_probes:
+        lines.append('#include <iostream>\n')
+    for i, probe in members:
+        full_paths = [os.path.join(prefix, 'include', header)
+                      for header in probe['headers_list']]
+        lines.append('#if {0}\n'.format
+                     (' && '.join(['__has_include("{0}")'.format(full_path)
+                                   for full_path in full_paths])))
+        lines.extend(['#include "{0}"\n'.format(full_path)
+                      for full_path in full_paths])
+        lines.append('#define SPACKDEV_HAVE_{0}\n'.format(i))
+        lines.append('#endif\n')
+    if preprocess_probes:
+        for i, probe in members:
+            lines.append('#ifdef SPACKDEV_HAVE_{0}\nspackdev_version {0} {1}\n#endif\n'.
+                         format(i, probe['define']))
+        lines.append('spackdev_end\n')
+    else:
+        lines.append('int main()\n{\n')
+        for i, probe in members:
+            lines.append('#ifdef SPACKDEV_HAVE_{0}\n    std::cout << "spackdev_version {0} " << {1} << std::endl;\n#endif\n'.
+                         format(i, probe['define']))
+        lines.append('    std::cout << "spackdev_end" << std::endl;\n')
+        lines.append('    return 0;\n}\n')
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        if preprocess_probes:
+            with open(os.path.join(tmpdir, 'tmp.cc'), 'w') as f:
+                f.writelines(lines)
+            command = compiler + ' -E -P {0} tmp.cc'.format(include_flags)
+            status_write("debug_config: " + command + "\n", verbose)
+            (status, output) = getstatusoutput(command, cwd=tmpdir)
+        elif compile_test_program(lines, compiler, include_flags, link_flags,
+                                  verbose, workdir=tmpdir):
+            (status, output) = getstatusoutput('./a.out', cwd=tmpdir)
+        else:
+            status = 1
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    if status or 'spackdev_end' not in output:
+        return None
+    values = {}
+    for match in _batch_value.finditer(output):
+        value = match.group(2)
+        if preprocess_probes:
+            value = literal_value(value)
+        values[int(match.group(1))] = value.rstrip() if value else None
+    return values
+
+
+# Extract versions of header-based externals with the preprocessor
+# where possible, rather than compiling, linking and running a test
+# program.
+preprocess_probes = True
+
+
+def library_probe(headers_list, define, regexp, include_flags, link_flags,
+                  compiler, prefixes, verbose):
+    """Returns (version, prefix), trying the preprocessor (if enabled) and
+    falling back to compiling and running a test program."""
+    if preprocess_probes and define:
+        result = preprocess_library_probe(headers_list, define, regexp,
+                                          include_flags, compiler, prefixes,
+                                          verbose)
+        if result:
+            return result
+    return compile_library_probe(headers_list, define, regexp,
+                                 include_flags, link_flags, compiler,
+                                 prefixes, verbose)
+
+
+_string_literal = re.compile(r'"((?:[^"\\]|\\.)*)"')
+_integer_literal = re.compile(r'^([0-9]+)[uUlL]*$')
+
+
+def literal_value(text):
+    """Return the value of a preprocessed define expansion consisting of
+    (possibly concatenated) string literals or a single integer literal,
+    or None for anything requiring evaluation."""
+    text = text.strip()
+    strings = _string_literal.findall(text)
+    if strings and not _string_literal.sub('', text).strip():
+        return ''.join(strings)
+    match = _integer_literal.match(text)
+    if match:
+        return match.group(1)
+    return None
+
+
+def preprocess_library_probe(headers_list, define, regexp, include_flags,
+                             compiler, prefixes, verbose):
+    """Find the first prefix providing all of headers_list and extract the
+    value of define with a single run of the preprocessor covering all
+    prefixes. Returns (version, prefix), or None if the value could not
+    be obtained this way."""
+    lines = []
+    for i, prefix in enumerate(prefixes):
+        full_paths = [os.path.join(prefix, 'include', header)
+                      for header in headers_list]
+        lines.append('#{0} {1}\n'.format('if' if i == 0 else 'elif',
+                                          ' && '.join(['__has_include("{0}")'.
+                                                       format(full_path) for
+                                                       full_path in full_paths])))
+        lines.extend(['#include "{0}"\n'.format(full_path)
+                      for full_path in full_paths])
+        lines.append('spackdev_prefix {0}\n'.format(i))
+        lines.append('spackdev_version {0}\n'.format(define))
+    lines.append('#endif\n')
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        with open(os.path.join(tmpdir, 'tmp.cc'), 'w') as f:
+            f.writelines(lines)
+        command = compiler + ' -E -P {0} tmp.cc'.format(include_flags)
+        status_write("debug_config: " + command + "\n", verbose)
+        (status, output) = getstatusoutput(command, cwd=tmpdir)
+        status_write(
+            "debug_config: preprocessing completed with status " + str(status)
+            + "\n", verbose)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    if status:
+        return None
+    # Prefix and version markers may be split over several lines.
+    markers = re.search(r'\bspackdev_prefix\s+([0-9]+)\s+spackdev_version\s+(.*)$',
+                        output, re.DOTALL)
+    if not markers:
+        if '__has_include' in output or 'spackdev_prefix' in output:
+            return None
+        # No prefix provides the headers.
+        return [None, None]
+    value = literal_value(markers.group(2))
+    if value is None:
+        return None
+    return [extract_version(value, regexp),
+            prefixes[int(markers.group(1))]]
+
+
+def extract_version(output, regexp):
+    if regexp:
+        match = re.search(regexp, output)
+        return match.group(0) if match else None
+    return output.rstrip()
+
+
+def compile_library_probe(headers_list, define, regexp, include_flags,
+                          link_flags, compiler, prefixes, verbose):
+    """Find the first prefix for which a test program including
+    headers_list compiles and links and, if define is specified, extract
+    its value by running the program. Returns (version, prefix)."""
     lines = []
     lines.append('#include <iostream>\n\n')
     lines.append('int main()\n{\n')
@@ -106,10 +502,7 @@ def find_library_version(library, headers,
     lines.append('    return 0;\n')
     lines.append('}\n')
 
-    olddir = os.getcwd()
     tmpdir = tempfile.mkdtemp()
-    os.chdir(tmpdir)
-    headers_list = listify(headers)
     good_prefix = None
     version = None
     for prefix in prefixes:
@@ -118,28 +511,23 @@ def find_library_version(library, headers,
             full_path = os.path.join(prefix, 'include', header)
             include_lines.append('#include "{0}"\n'.format(full_path))
         if compile_test_program(include_lines + lines, compiler, include_flags,
-                                link_flags):
+                                link_flags, verbose, workdir=tmpdir):
             good_prefix = prefix
             break
     if good_prefix and define:
         status_write(
             "debug_config: executing ./a.out:"
             + "\n", verbose)
-        (status, output) = commands.getstatusoutput('./a.out')
+        (status, output) = getstatusoutput('./a.out', cwd=tmpdir)
         status_write(
             "debug_config: execution completed with status " + str(status)
             + " and output: "
             + output
             + "\n", verbose)
         if not status:
-            if regexp:
-                match = re.search(regexp, output)
-                version = match.group(0)
-            else:
-                version = output.rstrip()
-    os.chdir(olddir)
-    (status, output) = commands.getstatusoutput('/bin/rm -r %s' % tmpdir)
-    return External_package(library, version, good_prefix)
+            version = extract_version(output, regexp)
+    shutil.rmtree(tmpdir, ignore_errors=True)
+    return [version, good_prefix]
 
 
 # def version_acceptable(the_str, min_version_list):
@@ -0,0 +1,131 @@
+# Identify the state of the sources of packages under development, so
+# that packages unchanged since their last successful build can be
+# skipped.
+
+import hashlib
+import os
+import subprocess
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+
+# Per-package record of the sources last built successfully.
+fingerprint_file = 'build-fingerprint'
+
+_vcs_dirs = ('.git', '.hg', '.svn')
+
+
+def _output(cmd, cwd):
+    return subprocess.check_output(cmd, cwd=cwd, stderr=subprocess.STDOUT)
+
+
+def _status_paths(status, prefix_length, separator):
+    for entry in status.split(separator):
+        if len(entry) > prefix_length:
+            yield entry[prefix_length:]
+        elif entry:
+            # E.g. the original path of a rename (git).
+            yield entry
+
+
+def _git_state(src):
+    status = _output(['git', 'status', '--porcelain', '-z',
+                      '--untracked-files=all'], src)
+    return _output(['git', 'rev-parse', 'HEAD'], src), status, \
+        _status_paths(status, 3, b'\0')
+
+
+def _hg_state(src):
+    status = _output(['hg', 'status'], src)
+    return _output(['hg', 'identify', '--id'], src), status, \
+        _status_paths(status, 2, b'\n')
+
+
+def _svn_state(src):
+    status = _output(['svn', 'status'], src)
+    return _output(['svnversion'], src), status, \
+        _status_paths(status, 8, b'\n')
+
+
+_vcs_states = {'.git': _git_state, '.hg': _hg_state, '.svn': _svn_state}
+
+
+def _stat_line(src, path):
+    try:
+        stat = os.lstat(os.path.join(src, path))
+        return '{0} {1} {2}\n'.format(path, stat.st_mtime, stat.st_size)
+    except OSError:
+        return '{0} -\n'.format(path)
+
+
+def _tree_state(src):
+    lines = []
+    for root, dirs, files in os.walk(src):
+        dirs[:] = sorted(d for d in dirs if d not in _vcs_dirs)
+        for name in sorted(files):
+            lines.append(_stat_line(src, os.path.relpath
+                                    (os.path.join(root, name), src)))
+    return ''.join(lines)
+
+
+def source_fingerprint(src):
+    """Return a digest identifying the state of the sources in src: the
+    current revision, the working copy status and the times and sizes of
+    modified files for git, Mercurial and Subversion checkouts, or the
+    times and sizes of all files otherwise."""
+    digest = hashlib.sha1()
+    for vcs_dir in _vcs_dirs:
+        if os.path.exists(os.path.join(src, vcs_dir)):
+            try:
+                (revision, status, paths) = _vcs_states[vcs_dir](src)
+            except (OSError, subprocess.CalledProcessError):
+                # VCS tool unavailable or unhappy: fall back.
+                break
+            digest.update(vcs_dir + '\n' + revision + status)
+            for path in sorted(set(paths)):
+                digest.update(_stat_line(src, path))
+            return digest.hexdigest()
+    digest.update(_tree_state(src))
+    return digest.hexdigest()
+
+
+def source_fingerprints(area, packages, jobs=None):
+    """Return a dict of the current source fingerprints of packages,
+    computed concurrently."""
+    if not packages:
+        return {}
+    pool = ThreadPool(jobs or cpu_count())
+    try:
+        fingerprints = pool.map(lambda package:
+                                source_fingerprint(os.path.join
+                                                   (area.srcs_dir, package)),
+                                packages)
+    finally:
+        pool.close()
+        pool.join()
+    return dict(zip(packages, fingerprints))
+
+
+def recorded_fingerprint(area, package):
+    """Return the fingerprint of the sources of package when it was last
+    built successfully, or None."""
+    try:
+        with open(os.path.join(area.package_dir(package),
+                               fingerprint_file), 'r') as f:
+            return f.read().strip()
+    except IOError:
+        return None
+
+
+def record_fingerprint(area, package, fingerprint):
+    # Avoid a circular import.
+    from fnal.spack.dev.cmd import write_file_atomically
+    write_file_atomically(os.path.join(area.package_dir(package),
+                                       fingerprint_file),
+                          fingerprint + '\n')
+
+
+def forget_fingerprint(area, package):
+    try:
+        os.remove(os.path.join(area.package_dir(package), fingerprint_file))
+    except OSError:
+        pass
@@ -0,0 +1,102 @@
+# Inter-process locks on the shared state of a SpackDev area: one for
+# the area metadata (packages.sd, specs, global environment) and one each
+# for the stage and environment of each package under development, so
+# that independent operations may proceed concurrently.
+#
+# Each lock has its own file (under spackdev-aux/locks) because POSIX
+# record locks held by a process are all released when it closes any
+# descriptor for the same file.
+
+import contextlib
+import os
+import threading
+
+import llnl.util.lock as lk
+from llnl.util import tty
+from llnl.util.filesystem import mkdirp
+
+import fnal.spack.dev as dev
+
+# Seconds to wait before telling the user we are waiting, and in total.
+_notice_timeout = 0.5
+_max_wait = 24 * 60 * 60
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+class Area_lock:
+    """A read/write lock on part of a SpackDev area, shared by the threads
+    of a process and nestable."""
+    def __init__(self, path, desc):
+        self.path = path
+        self.desc = desc
+        self._lock = lk.Lock(path)
+        self._guard = threading.RLock()
+
+    def _acquire(self, acquire):
+        with self._guard:
+            try:
+                acquire(_notice_timeout)
+            except lk.LockTimeoutError:
+                tty.msg('waiting for {0} (in use by another process)'.
+                        format(self.desc))
+                acquire(_max_wait)
+
+    def acquire_read(self):
+        self._acquire(self._lock.acquire_read)
+
+    def acquire_write(self):
+        self._acquire(self._lock.acquire_write)
+
+    def release_read(self):
+        with self._guard:
+            self._lock.release_read()
+
+    def release_write(self):
+        with self._guard:
+            self._lock.release_write()
+
+    @contextlib.contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextlib.contextmanager
+    def write(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+def _area_lock(base, name, desc):
+    path = os.path.join(base, dev.spackdev_aux_locks_subdir,
+                        '{0}.lock'.format(name))
+    with _locks_guard:
+        if path not in _locks:
+            mkdirp(os.path.dirname(path))
+            _locks[path] = Area_lock(path, desc)
+        return _locks[path]
+
+
+def metadata_lock(base):
+    """Lock on the package lists, specs and global environment of the
+    area at base."""
+    return _area_lock(base, 'metadata', 'SpackDev area metadata lock')
+
+
+def stage_lock(base, package):
+    """Lock on the stage and source directories of package."""
+    return _area_lock(base, '{0}.stage'.format(package),
+                      'stage lock for {0}'.format(package))
+
+
+def environment_lock(base, package):
+    """Lock on the environment and wrappers of package."""
+    return _area_lock(base, '{0}.env'.format(package),
+                      'environment lock for {0}'.format(package))
@@ -0,0 +1,180 @@
+# Export metrics describing SpackDev operations to a file in the
+# Prometheus text format, for collection by e.g. node_exporter's textfile
+# collector. Each operation merges its samples into the file (which
+# should therefore be dedicated to SpackDev) and replaces it atomically.
+
+import contextlib
+import os
+import re
+import time
+from collections import OrderedDict
+
+import llnl.util.lock as lk
+from llnl.util import tty
+
+# Environment variable naming the metrics file (saved by spack dev init
+# --metrics-file).
+metrics_file_var = 'SPACKDEV_METRICS_FILE'
+
+# Per-package count of compiler wrapper invocations (one byte per
+# invocation), in the package's env directory.
+wrapper_calls_file = 'wrapper-calls'
+
+_lock_timeout = 60
+
+# Type and help for each metric family.
+_families = {
+    'spackdev_init_phase_seconds':
+    ('gauge', 'Duration of each phase of the last spack dev init.'),
+    'spackdev_stage_seconds':
+    ('gauge', 'Time taken to fetch and stage the sources of a package.'),
+    'spackdev_stage_bytes':
+    ('gauge', 'Size of the staged sources of a package.'),
+    'spackdev_dependencies_installed':
+    ('gauge', 'Dependencies installed by the last installation, by origin.'),
+    'spackdev_dependencies_install_seconds':
+    ('gauge', 'Duration of the last installation of dependencies.'),
+    'spackdev_step_seconds':
+    ('gauge', 'Duration of the last configure, build or test of a package.'),
+    'spackdev_step_success':
+    ('gauge', 'Whether the last configure, build or test of a package succeeded.'),
+    'spackdev_step_timestamp_seconds':
+    ('gauge', 'Completion time of the last configure, build or test of a package.'),
+    'spackdev_wrapper_calls_total':
+    ('counter', 'Compiler wrapper invocations for a package since the wrappers were created.')
+}
+
+_sample_line = re.compile(r'^(?P<name>[a-zA-Z_:][a-zA-Z0-9_:]*)(?P<labels>\{.*\})?\s+(?P<value>\S+)\s*$')
+
+
+def metrics_file():
+    return os.environ.get(metrics_file_var)
+
+
+def enabled():
+    return bool(metrics_file())
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').\
+        replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{{{0}}}'.format(','.join('{0}="{1}"'.format(name, _escape(value))
+                                     for name, value in
+                                     sorted(labels.items())))
+
+
+def _read_samples(filename):
+    samples = OrderedDict()
+    try:
+        with open(filename, 'r') as f:
+            for line in f:
+                match = _sample_line.match(line)
+                if match:
+                    samples.setdefault(match.group('name'), OrderedDict())\
+                        [match.group('labels') or ''] = match.group('value')
+    except IOError:
+        pass
+    return samples
+
+
+def _format_samples(samples):
+    lines = []
+    for name in sorted(samples):
+        family = _families.get(name)
+        if family:
+            lines.append('# HELP {0} {1}\n'.format(name, family[1]))
+            lines.append('# TYPE {0} {1}\n'.format(name, family[0]))
+        for labels in sorted(samples[name]):
+            lines.append('{0}{1} {2}\n'.format(name, labels,
+                                               samples[name][labels]))
+    return ''.join(lines)
+
+
+def record(samples):
+    """Merge samples (a list of (name, labels, value) tuples) into the
+    metrics file, if one has been configured. Failures are reported, but
+    do not interrupt the operation being measured."""
+    filename = metrics_file()
+    if not filename or not samples:
+        return
+    # Avoid a circular import.
+    from fnal.spack.dev.cmd import write_file_atomically
+    area = os.environ.get('SPACKDEV_BASE', '')
+    lock = lk.Lock(filename + '.lock')
+    try:
+        lock.acquire_write(_lock_timeout)
+        try:
+            merged = _read_samples(filename)
+            for name, labels, value in samples:
+                labels = dict(labels, area=area)
+                merged.setdefault(name, OrderedDict())[_labels(labels)]\
+                    = '{0:.3f}'.format(value) if isinstance(value, float) \
+                    else str(value)
+            write_file_atomically(filename, _format_samples(merged))
+        finally:
+            lock.release_write()
+    except (IOError, OSError, lk.LockError) as e:
+        tty.warn('unable to record metrics in {0}: {1}'.format(filename, e))
+
+
+class Phase_timer:
+    """Time the phases of an operation."""
+    def __init__(self):
+        self.seconds = OrderedDict()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.seconds[name] = time.time() - start
+
+    def samples(self, metric):
+        return [(metric, {'phase': phase}, seconds) for
+                phase, seconds in self.seconds.items()]
+
+
+def tree_size(top):
+    size = 0
+    for root, dirs, files in os.walk(top):
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return size
+
+
+def wrapper_calls(area, package):
+    try:
+        return os.path.getsize(os.path.join(area.package_dir(package), 'env',
+                                            wrapper_calls_file))
+    except OSError:
+        return 0
+
+
+def record_results(area, step, results):
+    """Record the durations and outcomes of a step (configure, build or
+    test) for packages, and their compiler wrapper invocation counts."""
+    if not enabled():
+        return
+    now = time.time()
+    samples = []
+    for result in results:
+        if result.skipped:
+            continue
+        labels = {'package': result.package, 'step': step}
+        samples.extend([('spackdev_step_seconds', labels, result.seconds),
+                        ('spackdev_step_success', labels,
+                         1 if result.succeeded else 0),
+                        ('spackdev_step_timestamp_seconds', labels, now),
+                        ('spackdev_wrapper_calls_total',
+                         {'package': result.package},
+                         wrapper_calls(area, result.package))])
+    record(samples)
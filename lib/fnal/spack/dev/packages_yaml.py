@@ -4,6 +4,7 @@ from __future__ import print_function
 
 import os.path
 import shutil
+import sys
 import spack.architecture
 
 class Packages_yaml:
@@ -78,13 +79,26 @@ class Packages_yaml:
         packages = external_packages.keys()
         packages.sort()
         for package in packages:
-            external_package = external_packages[package]
+            found = external_packages[package]
+            if not isinstance(found, list):
+                found = [found]
             outfile.write(self.indent + package + ':\n')
             outfile.write(self.indent + self.indent + 'paths:\n')
-            outfile.write(self.indent + self.indent + self.indent + package)
-            if external_package.version:
-                outfile.write('@' + external_package.version)
-            outfile.write(': ' + external_package.pathname + '\n')
+            # Each spec may appear only once: keep the first (preferred)
+            # prefix found for it.
+            written = {}
+            for external_package in found:
+                spec = package
+                if external_package.version:
+                    spec += '@' + external_package.version
+                if spec in written:
+                    print('findext: warning: ignoring {0} in {1} (using {2})'.
+                          format(spec, external_package.pathname,
+                                 written[spec]), file=sys.stderr)
+                    continue
+                written[spec] = external_package.pathname
+                outfile.write(self.indent + self.indent + self.indent +
+                              spec + ': ' + external_package.pathname + '\n')
 
         def add_external_package(self, external_package):
             self.external_packages[external_package.name] = external_package
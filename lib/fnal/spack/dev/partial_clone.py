@@ -0,0 +1,94 @@
+# Depth-limited and partial (e.g. blobless) git clones of packages staged
+# for development, as an alternative to the full clones obtained via
+# Spack's fetcher, and the means to obtain the rest of their history
+# later.
+
+import os
+import subprocess
+
+from llnl.util import tty
+
+# Environment variables holding the default clone depth and filter for
+# staging (saved by spack dev init --clone-depth / --clone-filter).
+clone_depth_var = 'SPACKDEV_CLONE_DEPTH'
+clone_filter_var = 'SPACKDEV_CLONE_FILTER'
+
+
+class Clone_error(Exception):
+    pass
+
+
+def _git(src, *args):
+    cmd = ['git'] + list(args)
+    try:
+        return subprocess.check_output(cmd, cwd=src,
+                                       stderr=subprocess.STDOUT)
+    except subprocess.CalledProcessError as e:
+        raise Clone_error('{0} failed with status {1}:\n{2}'.
+                          format(' '.join(cmd), e.returncode, e.output))
+    except OSError as e:
+        raise Clone_error('unable to execute git: {0}'.format(e))
+
+
+def clone_settings(depth=None, filter_spec=None):
+    """Return the clone depth and filter to use, defaulting to those
+    saved in the area environment."""
+    if depth is None and os.environ.get(clone_depth_var):
+        depth = int(os.environ[clone_depth_var])
+    if filter_spec is None:
+        filter_spec = os.environ.get(clone_filter_var) or None
+    return depth or None, filter_spec
+
+
+def clone(fetcher, dest, depth=None, filter_spec=None):
+    """Clone the repository of the git fetcher into dest, with at most
+    depth commits of history and/or the given object filter (e.g.
+    blob:none), and check out the fetcher's tag, branch or commit."""
+    ref = fetcher.tag or fetcher.branch
+    commit = getattr(fetcher, 'commit', None)
+    if depth and not ref:
+        tty.warn('cannot limit the depth of a clone of {0} at commit {1}: '
+                 'fetching full history'.format(fetcher.url, commit))
+        depth = None
+    args = ['clone', '--quiet']
+    if depth:
+        args.extend(['--depth', str(depth)])
+    if filter_spec:
+        args.extend(['--filter', filter_spec])
+    if ref:
+        args.extend(['--branch', ref])
+    args.extend([fetcher.url, dest])
+    _git(os.path.dirname(dest) or os.curdir, *args)
+    if commit and not ref:
+        _git(dest, 'checkout', '--quiet', commit)
+    if getattr(fetcher, 'submodules', False):
+        args = ['submodule', '--quiet', 'update', '--init', '--recursive']
+        if depth:
+            args.extend(['--depth', str(depth)])
+        _git(dest, *args)
+
+
+def is_shallow(src):
+    return _git(src, 'rev-parse', '--is-shallow-repository').strip() \
+        == b'true'
+
+
+def partial_clone_filter(src):
+    try:
+        return _git(src, 'config', '--get',
+                    'remote.origin.partialclonefilter').strip() or None
+    except Clone_error:
+        return None
+
+
+def unshallow(src, deepen=None):
+    """Fetch deepen more commits of history for the current branch of
+    the shallow clone src or, by default, the full history of all
+    branches and tags."""
+    if deepen:
+        _git(src, 'fetch', '--quiet', '--deepen', str(deepen))
+    else:
+        # Single-branch clones are implied by --depth.
+        _git(src, 'config', 'remote.origin.fetch',
+             '+refs/heads/*:refs/remotes/origin/*')
+        _git(src, 'fetch', '--quiet', '--unshallow', '--tags', 'origin')
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+
+import os
+import os.path
+
+# Subdirectories of an installation prefix that never contain further
+# installation prefixes worth scanning.
+_prefix_subdirs = ('bin', 'include', 'lib', 'lib64', 'libexec', 'share',
+                   'etc', 'man', 'doc', 'src')
+
+
+def scan_directory(path):
+    '''Examine one directory of a scanned tree: return the executables and
+    top-level include entries if it looks like an installation prefix
+    (has bin/ or include/), and the subdirectories to scan further.'''
+    try:
+        entries = os.listdir(path)
+    except OSError:
+        return path, None, None, []
+    executables = None
+    includes = None
+    if 'bin' in entries:
+        try:
+            executables = os.listdir(os.path.join(path, 'bin'))
+        except OSError:
+            pass
+    if 'include' in entries:
+        try:
+            includes = os.listdir(os.path.join(path, 'include'))
+        except OSError:
+            pass
+    is_prefix = executables is not None or includes is not None
+    subdirs = []
+    for entry in entries:
+        if is_prefix and entry in _prefix_subdirs:
+            continue
+        subdir = os.path.join(path, entry)
+        # Do not follow symbolic links, to avoid cycles and duplicates.
+        if os.path.isdir(subdir) and not os.path.islink(subdir):
+            subdirs.append(subdir)
+    return path, executables, includes, subdirs
+
+
+class Prefix_index:
+    '''Index of the executables and headers provided by the installation
+    prefixes found under a set of root directories, built in a single
+    (parallel) pass over the trees.'''
+    def __init__(self, roots, pool, max_depth=4):
+        self.executables = {}
+        self.includes = {}
+        self.prefixes = []
+        frontier = [os.path.abspath(root) for root in roots]
+        depth = 0
+        while frontier:
+            next_frontier = []
+            for path, executables, includes, subdirs in \
+                    pool.map(scan_directory, frontier):
+                if executables is not None or includes is not None:
+                    self.prefixes.append(path)
+                    for executable in executables or []:
+                        self.executables.setdefault(executable, []).append(path)
+                    for include in includes or []:
+                        self.includes.setdefault(include, []).append(path)
+                if depth < max_depth:
+                    next_frontier.extend(subdirs)
+            frontier = next_frontier
+            depth += 1
+        self.prefixes.sort()
+
+    def prefixes_for_executable(self, executable):
+        '''Returns a sorted list of prefixes providing an executable
+        bin/executable.'''
+        return sorted([prefix for prefix in
+                       self.executables.get(executable, []) if
+                       os.access(os.path.join(prefix, 'bin', executable),
+                                 os.X_OK)])
+
+    def prefixes_for_headers(self, headers):
+        '''Returns a sorted list of prefixes providing all of the given
+        headers (relative to include/).'''
+        candidates = None
+        for header in headers:
+            top = header.split('/', 1)[0]
+            found = set(self.includes.get(top, []))
+            candidates = found if candidates is None else candidates & found
+        return sorted([prefix for prefix in candidates or [] if
+                       all(os.path.exists(os.path.join(prefix, 'include',
+                                                       header))
+                           for header in headers)])
@@ -0,0 +1,244 @@
+import os
+import re
+import tempfile
+
+from six.moves import cPickle
+
+# Bytes examined to decide whether a file is text.
+_sniff_size = 8192
+
+# Files are rewritten in chunks of this size, with enough of each chunk
+# carried over to the next (at least the length of the longest path) that
+# no path is split between chunks.
+_chunk_size = 1 << 20
+_overlap = 4096
+
+# Binary files whose embedded paths may not be padded.
+_opaque_files = ('.ninja_deps',)
+
+
+class Not_relocatable(Exception):
+    """Raised for a binary file containing paths that cannot be rewritten
+    in place (the new path is longer than the old)."""
+    def __init__(self, path):
+        Exception.__init__(self, path)
+        self.path = path
+
+
+def path_matcher(old):
+    """Return a regex matching old as a complete path or path prefix."""
+    return re.compile(re.escape(old) + r'(?=/|$|[^\w.+-])')
+
+
+def relocate_string(value, matcher, new):
+    return matcher.sub(new.replace('\\', r'\\'), value)
+
+
+def _temporary_for(path):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                    prefix='.{0}.'.format(os.path.basename(path)))
+    return os.fdopen(fd, 'wb'), tmp_path
+
+
+def _replace(path, tmp_path, stat):
+    """Replace path with tmp_path, preserving the mode and times of path
+    (so that build tools do not consider it to have changed)."""
+    os.chmod(tmp_path, stat.st_mode & 0o7777)
+    os.utime(tmp_path, (stat.st_atime, stat.st_mtime))
+    os.rename(tmp_path, path)
+
+
+def _rewrite_file(path, contents):
+    """Replace the contents of path atomically."""
+    stat = os.stat(path)
+    (f, tmp_path) = _temporary_for(path)
+    try:
+        with f:
+            f.write(contents)
+        _replace(path, tmp_path, stat)
+    except:
+        os.remove(tmp_path)
+        raise
+
+
+def _copy_bytes(src, dest, count):
+    while count:
+        data = src.read(min(count, _chunk_size))
+        if not data:
+            break
+        dest.write(data)
+        count -= len(data)
+
+
+def _relocate_stream(path, relocate_chunk, matcher, new):
+    """Rewrite path atomically chunk by chunk with relocate_chunk,
+    returning True if it was changed. Nothing is written unless a chunk
+    changes."""
+    stat = os.stat(path)
+    out = None
+    try:
+        with open(path, 'rb') as f:
+            offset = 0
+            carry = b''
+            while True:
+                chunk = f.read(_chunk_size)
+                buffer = carry + chunk
+                (relocated, carry)\
+                    = relocate_chunk(buffer, matcher, new, not chunk)
+                consumed = len(buffer) - len(carry)
+                if out is None and relocated != buffer[:consumed]:
+                    (out, tmp_path) = _temporary_for(path)
+                    # Unchanged up to here.
+                    with open(path, 'rb') as original:
+                        _copy_bytes(original, out, offset)
+                if out is not None:
+                    out.write(relocated)
+                offset += consumed
+                if not chunk:
+                    break
+        if out is None:
+            return False
+        out.close()
+        _replace(path, tmp_path, stat)
+        return True
+    except:
+        if out is not None:
+            out.close()
+            os.remove(tmp_path)
+        raise
+
+
+def _relocate_text_chunk(buffer, matcher, new, final):
+    """Return the relocated part of buffer that can be decided now and
+    the remainder, to be prepended to the next chunk."""
+    if final:
+        return relocate_string(buffer, matcher, new), b''
+    # Matches starting within _overlap of the end (with the character
+    # following them) may continue into the next chunk.
+    limit = max(len(buffer) - _overlap, 0)
+    relocated = []
+    pos = 0
+    for match in matcher.finditer(buffer):
+        if match.start() >= limit:
+            break
+        relocated.extend([buffer[pos:match.start()], new])
+        pos = match.end()
+    end = max(pos, limit)
+    relocated.append(buffer[pos:end])
+    return b''.join(relocated), buffer[end:]
+
+
+def _relocate_binary_chunk(buffer, matcher, new, final):
+    """As _relocate_text_chunk, for the NUL-terminated strings of binary
+    files: strings continuing into the next chunk are carried over."""
+    if final:
+        return relocate_binary(buffer, matcher, new), b''
+    nul = buffer.rfind(b'\0')
+    relocated = relocate_binary(buffer[:nul + 1], matcher, new)
+    rest = buffer[nul + 1:]
+    if len(rest) > _overlap:
+        # Pass on what cannot be part of a path to be rewritten.
+        match = matcher.search(rest)
+        keep = match.start() if match else len(rest) - _overlap
+        relocated += rest[:keep]
+        rest = rest[keep:]
+    return relocated, rest
+
+
+def _check_opaque_chunk(buffer, matcher, new, final):
+    (relocated, carry) = _relocate_text_chunk(buffer, matcher, new, final)
+    if relocated != buffer[:len(buffer) - len(carry)]:
+        raise Not_relocatable(None)
+    return relocated, carry
+
+
+def relocate_binary(contents, matcher, new):
+    """Rewrite old paths in the NUL-terminated strings of binary contents
+    (e.g. RPATHs and debug information), padding each rewritten string
+    with NULs so that no offsets change."""
+    def relocate_c_string(match):
+        value = match.group(0)[:-1]
+        relocated = relocate_string(value, matcher, new)
+        if len(relocated) > len(value):
+            raise Not_relocatable(None)
+        return relocated + b'\0' * (len(value) - len(relocated) + 1)
+    return re.sub(matcher.pattern + r'[^\0]*\0', relocate_c_string, contents)
+
+
+def relocate_regular_file(path, matcher, new):
+    """Rewrite old paths in a file, returning True if it was changed.
+    Files are streamed rather than read whole, so that large objects,
+    archives and debug information do not need to fit in memory."""
+    with open(path, 'rb') as f:
+        binary = b'\0' in f.read(_sniff_size)
+    if not binary:
+        relocate_chunk = _relocate_text_chunk
+    elif os.path.basename(path) in _opaque_files:
+        relocate_chunk = _check_opaque_chunk
+    else:
+        relocate_chunk = _relocate_binary_chunk
+    try:
+        return _relocate_stream(path, relocate_chunk, matcher, new)
+    except Not_relocatable:
+        raise Not_relocatable(path)
+
+
+def relocate_pickle(path, matcher, new):
+    """Rewrite old paths in the values of a pickled environment."""
+    with open(path, 'rb') as f:
+        environment = cPickle.load(f)
+    relocated = dict((var, relocate_string(val, matcher, new)) for
+                     var, val in environment.items())
+    if relocated == environment:
+        return False
+    _rewrite_file(path, cPickle.dumps(relocated, protocol=2))
+    return True
+
+
+def relocate_symlink(path, matcher, new):
+    target = os.readlink(path)
+    relocated = relocate_string(target, matcher, new)
+    if relocated == target:
+        return False
+    os.remove(path)
+    os.symlink(relocated, path)
+    return True
+
+
+def relocate_file(path, matcher, new):
+    if os.path.islink(path):
+        return relocate_symlink(path, matcher, new)
+    elif not os.path.isfile(path):
+        # E.g. sockets and FIFOs.
+        return False
+    elif path.endswith('.pickle'):
+        return relocate_pickle(path, matcher, new)
+    else:
+        return relocate_regular_file(path, matcher, new)
+
+
+def relocate_tree(top, old, new, exclude=()):
+    """Rewrite occurrences of path old as new in the files (text and
+    binary files, pickled environments and symbolic links) under top,
+    skipping directories named in exclude. Returns the lists of changed
+    files and of binary files that could not be rewritten."""
+    matcher = path_matcher(old)
+    changed = []
+    not_relocated = []
+
+    def relocate(path):
+        try:
+            if relocate_file(path, matcher, new):
+                changed.append(path)
+        except Not_relocatable:
+            not_relocated.append(path)
+
+    if not os.path.isdir(top) or os.path.islink(top):
+        relocate(top)
+        return changed, not_relocated
+    for root, dirs, files in os.walk(top):
+        dirs[:] = [d for d in dirs if d not in exclude]
+        for name in files + [d for d in dirs if
+                             os.path.islink(os.path.join(root, d))]:
+            relocate(os.path.join(root, name))
+    return changed, not_relocated
@@ -0,0 +1,115 @@
+import os
+import subprocess
+import threading
+import time
+
+from fnal.spack.dev.environment import load_environment
+
+
+class Package_result:
+    """Outcome of running a command for a package under development."""
+    def __init__(self, package, returncode, output='', seconds=0.0,
+                 skipped=False):
+        self.package = package
+        self.returncode = returncode
+        self.output = output
+        self.seconds = seconds
+        self.skipped = skipped
+
+    @property
+    def succeeded(self):
+        return self.returncode == 0 and not self.skipped
+
+
+def run_in_package(package, cmd, cwd, environment=None):
+    """Run cmd in directory cwd in the build environment of package,
+    capturing its combined output."""
+    if environment is None:
+        environment = load_environment(package)
+    if not os.path.isdir(cwd):
+        return Package_result(package, 1,
+                              'directory {0} does not exist\n'.format(cwd))
+    start = time.time()
+    try:
+        process = subprocess.Popen(cmd, cwd=cwd, env=environment,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT,
+                                   close_fds=True)
+        output = process.communicate()[0]
+        returncode = process.returncode
+    except OSError as e:
+        output = 'unable to execute {0}: {1}\n'.format(cmd[0], e)
+        returncode = 127
+    return Package_result(package, returncode, output, time.time() - start)
+
+
+def run_for_packages(packages, task, jobs=1, dependencies=None,
+                     callback=None):
+    """Call task(package), which should return a Package_result, for each
+    of packages, with at most jobs calls in progress at once.
+
+    If dependencies (a dict of sets of packages by package) is specified,
+    a package is started only once all of its dependencies in packages
+    have completed successfully; packages with failed dependencies are
+    skipped. If specified, callback is called with each result as it
+    becomes available. Returns the results in the order of packages.
+    """
+    dependencies = dependencies or {}
+    results = {}
+    pending = list(packages)
+    running = set()
+    condition = threading.Condition()
+
+    def worker(package):
+        try:
+            result = task(package)
+        except (Exception, SystemExit) as e:
+            # Including tty.die(), which would otherwise leave us
+            # waiting for this package forever.
+            result = Package_result(package, 1, '{0}\n'.format(e))
+        # Report before recording, so that all callbacks have completed
+        # by the time we return.
+        try:
+            if callback:
+                callback(result)
+        finally:
+            with condition:
+                results[package] = result
+                running.discard(package)
+                condition.notify()
+
+    with condition:
+        while pending or running:
+            started = False
+            for package in list(pending):
+                deps = [dep for dep in dependencies.get(package, ()) if
+                        dep in packages and dep != package]
+                if any(dep in results and not results[dep].succeeded
+                       for dep in deps):
+                    pending.remove(package)
+                    results[package]\
+                        = Package_result(package, None,
+                                         'skipped due to failed dependencies\n',
+                                         skipped=True)
+                    if callback:
+                        callback(results[package])
+                    started = True
+                elif len(running) < max(jobs, 1) and \
+                     all(dep in results for dep in deps):
+                    pending.remove(package)
+                    running.add(package)
+                    thread = threading.Thread(target=worker, args=(package,))
+                    thread.daemon = True
+                    thread.start()
+                    started = True
+            if not started:
+                if not running:
+                    # Remaining packages wait on each other.
+                    for package in pending:
+                        results[package]\
+                            = Package_result(package, None,
+                                             'skipped due to circular dependencies\n',
+                                             skipped=True)
+                    break
+                condition.wait()
+    return [results[package] for package in packages]
@@ -0,0 +1,88 @@
+import os
+
+from llnl.util.filesystem import mkdirp
+import spack.hash_types as ht
+from spack.spec import Spec
+import spack.util.spack_json as sjson
+
+_index_file = 'index.json'
+
+
+class Spec_store:
+    """Concretized specs of a SpackDev area, stored as one file per DAG
+    node (by build hash) with an index of root specs and of node hashes by
+    package name. Nodes are read and rebuilt into Spec objects only as
+    required, and at most once per store object.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self._index = None
+        self._specs = {}
+
+    @property
+    def index_file(self):
+        return os.path.join(self.directory, _index_file)
+
+    def exists(self):
+        return os.path.exists(self.index_file)
+
+    def _node_file(self, dag_hash):
+        return os.path.join(self.directory, '{0}.json'.format(dag_hash))
+
+    def write(self, specs):
+        """Store the given root specs and all their dependencies."""
+        # Avoid a circular import.
+        from fnal.spack.dev.cmd import write_file_atomically
+        mkdirp(self.directory)
+        roots = []
+        names = {}
+        seen = set()
+        for root in sorted(specs, key=lambda spec: spec.name):
+            roots.append(root.build_hash())
+            for node in root.traverse(deptype='all'):
+                dag_hash = node.build_hash()
+                names[node.name] = dag_hash
+                if dag_hash in seen:
+                    continue
+                seen.add(dag_hash)
+                node_file = self._node_file(dag_hash)
+                if not os.path.exists(node_file):
+                    write_file_atomically\
+                        (node_file,
+                         sjson.dump(node.to_node_dict(hash=ht.build_hash)))
+        write_file_atomically(self.index_file,
+                              sjson.dump({'roots': roots, 'names': names}))
+        self._index = None
+        self._specs = {}
+
+    def index(self):
+        if self._index is None:
+            with open(self.index_file, 'r') as f:
+                self._index = sjson.load(f)
+        return self._index
+
+    def names(self):
+        return sorted(self.index()['names'].keys())
+
+    def spec(self, dag_hash):
+        """Return the Spec with the given build hash, with its
+        dependencies."""
+        spec = self._specs.get(dag_hash)
+        if spec is None:
+            with open(self._node_file(dag_hash), 'r') as f:
+                node = sjson.load(f)
+            spec = Spec.from_node_dict(node)
+            name = next(iter(node))
+            for dep_name, dep_hash, dep_types in\
+                Spec.read_yaml_dep_specs(node[name].get('dependencies', {})):
+                spec._add_dependency(self.spec(dep_hash), dep_types)
+            self._specs[dag_hash] = spec
+        return spec
+
+    def spec_for(self, name):
+        """Return the Spec for the named package, or None."""
+        dag_hash = self.index()['names'].get(name)
+        return self.spec(dag_hash) if dag_hash else None
+
+    def roots(self):
+        return [self.spec(dag_hash) for dag_hash in self.index()['roots']]
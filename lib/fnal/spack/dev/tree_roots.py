@@ -0,0 +1,106 @@
+# Placement of the build, install and tmp trees of a SpackDev area
+# elsewhere (e.g. on node-local scratch or tmpfs) with symbolic links in
+# the area. Each placed tree holds a marker file naming its area, so that
+# a tree that has been wiped, or reused by another area, is detected
+# rather than silently rebuilt or shared.
+
+import hashlib
+import os
+import shutil
+
+from llnl.util import tty
+from llnl.util.filesystem import mkdirp
+
+# Environment variables holding the roots (saved by spack dev init
+# --build-root / --install-root).
+build_root_var = 'SPACKDEV_BUILD_ROOT'
+install_root_var = 'SPACKDEV_INSTALL_ROOT'
+
+# Trees of an area, and the root under which each is placed.
+trees = ('build', 'install', 'tmp')
+_tree_roots = {'build': 'build', 'install': 'install', 'tmp': 'build'}
+
+marker_file = '.spackdev-area'
+
+
+def area_id(base):
+    """Name of the directory for the area at base under a root, unique
+    to the area's location so that roots may be shared."""
+    return '{0}-{1}'.format(os.path.basename(base),
+                            hashlib.sha1(base.encode('utf-8')).
+                            hexdigest()[:8])
+
+
+def tree_path(base, tree):
+    """Return the real location of tree in the area at base."""
+    path = os.path.join(base, tree)
+    if os.path.islink(path):
+        return os.path.join(os.path.dirname(path), os.readlink(path))
+    return path
+
+
+def placed_root(base, tree):
+    """Return the root under which tree of the area at base was placed,
+    or None."""
+    path = os.path.join(base, tree)
+    if not os.path.islink(path):
+        return None
+    return os.path.dirname(os.path.dirname(tree_path(base, tree)))
+
+
+def remove_tree(base, tree):
+    path = os.path.join(base, tree)
+    if os.path.islink(path):
+        shutil.rmtree(tree_path(base, tree), ignore_errors=True)
+        os.remove(path)
+    else:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _marker_contents(base, tree):
+    return '{0}\n{1}\n'.format(base, tree)
+
+
+def place_trees(base, build_root=None, install_root=None):
+    """Create the trees of the area at base under build_root and
+    install_root as specified, with symbolic links from the area."""
+    roots = {'build': build_root, 'install': install_root}
+    for tree in trees:
+        root = roots[_tree_roots[tree]]
+        if not root:
+            continue
+        path = os.path.join(root, area_id(base), tree)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        mkdirp(path)
+        with open(os.path.join(path, marker_file), 'w') as f:
+            f.write(_marker_contents(base, tree))
+        os.symlink(path, os.path.join(base, tree))
+
+
+def tree_problems(base):
+    """Return a description of each placed tree of the area at base that
+    has been wiped or now belongs to another area."""
+    problems = []
+    for tree in trees:
+        if not os.path.islink(os.path.join(base, tree)):
+            continue
+        path = tree_path(base, tree)
+        try:
+            with open(os.path.join(path, marker_file), 'r') as f:
+                contents = f.read()
+        except IOError:
+            problems.append('{0} tree {1} has been wiped'.format(tree, path))
+            continue
+        if contents != _marker_contents(base, tree):
+            problems.append('{0} tree {1} belongs to another area ({2})'.
+                            format(tree, path, contents.split('\n')[0]))
+    return problems
+
+
+def check_trees(area):
+    problems = tree_problems(area.base)
+    if problems:
+        tty.die('{0}: re-create the affected trees with spack dev init '
+                '--resume (with --force if the area environment is '
+                'active)'.format('; '.join(problems)))
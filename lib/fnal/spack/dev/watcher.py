@@ -0,0 +1,196 @@
+# Report which packages under development have had their sources
+# changed, using inotify where available (Linux) or else by polling.
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import re
+import select
+import struct
+import time
+
+from llnl.util import tty
+
+# From <sys/inotify.h>.
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_ISDIR = 0x40000000
+_IN_CLOEXEC = 0x00080000
+
+_watch_mask = _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | \
+              _IN_CREATE | _IN_DELETE | _IN_ONLYDIR
+_event_header = struct.Struct('iIII')
+
+# Directories not watched and files whose changes are ignored (version
+# control metadata and editor droppings).
+_ignored_dirs = ('.git', '.hg', '.svn', 'CVS')
+_ignored_files = re.compile(r'(?:^\.#|^#.*#$|~$|\.sw[a-p]$|^4913$)')
+
+
+def _walk_dirs(top):
+    for root, dirs, files in os.walk(top):
+        dirs[:] = [d for d in dirs if d not in _ignored_dirs]
+        yield root
+
+
+def _is_ignored(path):
+    name = os.path.basename(path)
+    return name in _ignored_dirs or _ignored_files.search(name)
+
+
+class Inotify_watcher:
+    """Watch the source trees of packages (a dict of directories by
+    package name) with inotify."""
+    def __init__(self, sources):
+        libc_name = ctypes.util.find_library('c')
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self._libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+        self._fd = self._libc.inotify_init1(_IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self._watches = {}
+        self.sources = sources
+        try:
+            for package, top in sources.items():
+                self._add_tree(package, top)
+        except OSError:
+            self.close()
+            raise
+
+    def _add_tree(self, package, top):
+        for path in _walk_dirs(top):
+            wd = self._libc.inotify_add_watch\
+                 (self._fd, path.encode('utf-8'), _watch_mask)
+            if wd < 0:
+                error = ctypes.get_errno()
+                if error == errno.ENOENT:
+                    # Already gone.
+                    continue
+                raise OSError(error, 'unable to watch {0}{1}'.format
+                              (path,
+                               ' (see fs.inotify.max_user_watches)' if
+                               error == errno.ENOSPC else ''))
+            self._watches[wd] = (package, path)
+
+    def close(self):
+        os.close(self._fd)
+
+    def wait(self, timeout=None):
+        """Return the set of packages with changed sources, waiting at most
+        timeout seconds (or indefinitely) for a change."""
+        changed = set()
+        while True:
+            ready = select.select([self._fd], [], [], timeout)[0]
+            if not ready:
+                return changed
+            buf = os.read(self._fd, 65536)
+            offset = 0
+            while offset < len(buf):
+                (wd, mask, cookie, length)\
+                    = _event_header.unpack_from(buf, offset)
+                offset += _event_header.size
+                name = buf[offset:offset + length].rstrip(b'\0').\
+                       decode('utf-8', 'replace')
+                offset += length
+                if mask & _IN_Q_OVERFLOW:
+                    # Events were lost.
+                    changed.update(self.sources.keys())
+                    continue
+                if mask & _IN_IGNORED:
+                    self._watches.pop(wd, None)
+                    continue
+                if wd not in self._watches:
+                    continue
+                package, directory = self._watches[wd]
+                path = os.path.join(directory, name)
+                if _is_ignored(path):
+                    continue
+                if mask & _IN_ISDIR and mask & (_IN_CREATE | _IN_MOVED_TO):
+                    self._add_tree(package, path)
+                changed.add(package)
+            if changed:
+                return changed
+
+
+class Polling_watcher:
+    """Watch the source trees of packages (a dict of directories by
+    package name) by comparing the state of their files every interval
+    seconds."""
+    def __init__(self, sources, interval=1.0):
+        self.sources = sources
+        self.interval = interval
+        self._states = dict((package, self._state(top)) for
+                            package, top in sources.items())
+
+    @staticmethod
+    def _state(top):
+        state = {}
+        for root in _walk_dirs(top):
+            try:
+                names = os.listdir(root)
+            except OSError:
+                # Removed since it was walked: as if empty.
+                continue
+            for name in names:
+                path = os.path.join(root, name)
+                if _is_ignored(path):
+                    continue
+                try:
+                    stat = os.lstat(path)
+                    state[path] = (stat.st_mtime, stat.st_size, stat.st_mode)
+                except OSError:
+                    pass
+        return state
+
+    def close(self):
+        pass
+
+    def wait(self, timeout=None):
+        """Return the set of packages with changed sources, waiting at most
+        timeout seconds (or indefinitely) for a change."""
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            changed = set()
+            for package, top in self.sources.items():
+                state = self._state(top)
+                if state != self._states[package]:
+                    self._states[package] = state
+                    changed.add(package)
+            if changed:
+                return changed
+            if deadline is not None and time.time() >= deadline:
+                return changed
+            time.sleep(self.interval if deadline is None else
+                       max(min(self.interval, deadline - time.time()), 0))
+
+
+def make_watcher(sources, poll=False):
+    """Return an inotify watcher for sources if possible (and not poll),
+    else a polling watcher."""
+    if not poll:
+        try:
+            return Inotify_watcher(sources)
+        except (AttributeError, OSError) as e:
+            tty.warn('unable to use inotify ({0}): polling for changes instead'.
+                     format(e))
+    return Polling_watcher(sources)
+
+
+def wait_for_changes(watcher, delay):
+    """Wait for a change, and then until there have been none for delay
+    seconds. Returns the set of packages with changed sources."""
+    changed = watcher.wait()
+    while True:
+        more = watcher.wait(delay)
+        if not more:
+            return changed
+        changed.update(more)
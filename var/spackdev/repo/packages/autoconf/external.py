@@ -1,6 +1,6 @@
 #!/usr/bin/env python
 
-from spackdev.external_tools import find_executable_version
+from fnal.spack.dev.external_tools import find_executable_version
 
 
 class Autoconf:
@@ -1,6 +1,6 @@
 #!/usr/bin/env python
 
-from spackdev.external_tools import find_library_version
+from fnal.spack.dev.external_tools import find_library_version
 
 
 class Openssl: